@@ -0,0 +1,273 @@
+"""
+Нагрузочный прогон основных обработчиков бота без подключения к Discord:
+создание тикета (TicketModal.callback), закрытие (handle_ticket_close и
+конвейер close_jobs до удаления канала), отзыв (FeedbackModal.callback)
+и generate_pdf. Для каждого — пропускная способность, p50/p99 и пик памяти.
+
+    cd project
+    python benchmarks/bench_ticket_flow.py --tickets 200 --concurrency 20 --messages 300
+
+Объекты nextcord заменены заглушками из benchmarks/fake_discord.py,
+задержка REST API задаётся --rest-latency; вложения скачиваются по HTTP
+с локального сервера. Бот работает во временной папке (своя БД, logs,
+attachments). --source history — сообщения догружаются через
+TextChannel.history (бот перезапускался), recorded — уже записаны слушателем.
+"""
+
+import os
+import sys
+import time
+import json
+import shutil
+import asyncio
+import argparse
+import resource
+import tempfile
+import tracemalloc
+from collections import namedtuple
+from datetime import timedelta
+from types import SimpleNamespace
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_discord import FakeDiscord, FakeInteraction, AttachmentServer, sample_files, history
+
+GUILD_ID, CATEGORY_ID, ADMIN_CHANNEL_ID, ADMIN_ROLE_ID, SUPPORT_ROLE_ID = 1, 10, 11, 12, 13
+
+Result = namedtuple("Result", "name count seconds latencies peak_mb")
+
+
+def _percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float("nan")
+
+
+def _peak_mb() -> float:
+    """Пик памяти: куча Python с начала сценария (--tracemalloc) или максимальный RSS бота и воркеров рендера"""
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return (usage + children) / 1024  # ru_maxrss в КБ (Linux)
+
+
+def _reset_peak():
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+
+
+async def _drive(name: str, op, count: int, concurrency: int) -> Result:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            await op(i)
+            latencies.append(time.perf_counter() - started)
+
+    _reset_peak()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return Result(name, count, time.perf_counter() - started, latencies, _peak_mb())
+
+
+def _report(result: Result):
+    rate = result.count / result.seconds if result.seconds else float("inf")
+    print(f"{result.name:>18}: {result.count:6d} ops {rate:9.1f} ops/s   "
+          f"p50 {_percentile(result.latencies, 0.5) * 1000:9.1f} ms   "
+          f"p99 {_percentile(result.latencies, 0.99) * 1000:9.1f} ms   "
+          f"peak {result.peak_mb:7.1f} MB")
+
+
+def _labels(labels: tuple) -> str:
+    return ",".join(f"{k}={v}" for k, v in labels)
+
+
+def _setup_world(args, server: AttachmentServer):
+    world = FakeDiscord(rest_latency=args.rest_latency / 1000)
+    guild = world.guild(GUILD_ID)
+    admin = guild.role(ADMIN_ROLE_ID, "admin")
+    guild.role(SUPPORT_ROLE_ID, "support")
+    category = guild.category(CATEGORY_ID)
+    guild.text_channel(ADMIN_CHANNEL_ID, "admin-log")
+    staff = world.member(guild, "staff", roles=[admin])
+    users = [world.member(guild, f"user{i}") for i in range(args.users)]
+    return world, guild, category, staff, users
+
+
+async def main(args):
+    import main as app
+    from database.session import engine
+    from database.migrations import run_migrations
+    from utils.jobs import JobQueue
+    from utils.pdf_generator import generate_pdf
+
+    run_migrations(engine)
+
+    server = await AttachmentServer(sample_files(args.images)).start()
+    world, guild, category, staff, users = _setup_world(args, server)
+    world.patch(app.bot)
+
+    # Конвейер закрытия — тот же, что в боте, но с отметкой о завершении
+    done = {}
+
+    def track(fn):
+        async def stage(job):
+            await fn(job)
+            done[job["ticket_id"]].set_result(time.perf_counter())
+        return stage
+
+    stages = list(app.close_jobs.stages)
+    stages[-1] = (stages[-1][0], track(stages[-1][1]))
+    app.close_jobs = JobQueue("ticket_close", stages, workers=args.workers, max_attempts=1, poll_interval=0.1)
+    await app.close_jobs.start()
+    await app.renderer.warm_up()
+    if args.tracemalloc:
+        # После запуска воркеров рендера: дочерние процессы трассировку не наследуют
+        tracemalloc.start()
+
+    # ─── создание ─────────────────────────────────────────────────────────
+    tickets = [None] * args.tickets
+
+    async def create(i):
+        user = users[i % len(users)]
+        interaction = FakeInteraction(user)
+        modal = app.TicketModal("bug")
+        modal.issue = SimpleNamespace(value=f"Проблема №{i}: не работает " + "очень " * (i % 20))
+        await modal.callback(interaction)
+        reply = interaction.replies[-1]
+        assert reply.startswith("✅"), reply
+        channel = world.get_channel(int(reply.split("<#")[1].rstrip(">")))
+        tickets[i] = (int(channel.name.split("-")[1]), channel, user)
+
+    results = [await _drive("TicketModal", create, args.tickets, args.concurrency)]
+
+    # Переписка в каналах: вложения — каждое --attachment-every сообщение
+    for ticket_id, channel, user in tickets:
+        history(channel, [user, staff], args.messages, server.urls(), args.attachment_every)
+        if args.source == "history":
+            channel.created_at -= timedelta(days=1)
+        else:
+            for message in channel.messages:
+                await app.recorder.on_message(message)
+
+    # ─── закрытие ─────────────────────────────────────────────────────────
+    enqueued = {}
+    fetches_before = world.member_fetches
+
+    async def close(i):
+        ticket_id, channel, _ = tickets[i]
+        done[ticket_id] = asyncio.get_running_loop().create_future()
+        enqueued[ticket_id] = time.perf_counter()
+        await app.handle_ticket_close(FakeInteraction(staff, channel=channel))
+
+    results.append(await _drive("handle_ticket_close", close, args.tickets, args.concurrency))
+    started = min(enqueued.values())
+    finished, pending = await asyncio.wait(done.values(), timeout=args.timeout)
+    completed = {tid: f.result() for tid, f in done.items() if f in finished}
+    results.append(Result("close pipeline", len(completed),
+                          (max(completed.values()) - started) if completed else 0.0,
+                          [completed[tid] - enqueued[tid] for tid in completed], _peak_mb()))
+    if pending:
+        print(f"[WARN] не завершено задач закрытия за {args.timeout} с: {len(pending)}")
+    # Создатели тикетов — участники сервера: при закрытии их должен отдавать кеш, а не API
+    close_fetches = world.member_fetches - fetches_before
+
+    # ─── отзывы ───────────────────────────────────────────────────────────
+    async def feedback(i):
+        ticket_id, _, user = tickets[i]
+        modal = app.FeedbackModal(ticket_id, user.id, 1 + i % 5, GUILD_ID)
+        modal.comment = SimpleNamespace(value=f"Отзыв {i}")
+        interaction = FakeInteraction(user)
+        await modal.callback(interaction)
+        assert interaction.replies[-1].startswith("✅"), interaction.replies[-1]
+
+    results.append(await _drive("FeedbackModal", feedback, args.tickets, args.concurrency))
+
+    # ─── PDF ──────────────────────────────────────────────────────────────
+    os.makedirs("pdf_attachments", exist_ok=True)
+    attachments = []
+    for name, body in server.files.items():
+        path = os.path.join("pdf_attachments", name)
+        with open(path, "wb") as f:
+            f.write(body)
+        attachments.append((path, f"{server.base_url}/{name}"))
+    messages = [{"author": f"user{i % 7}", "content": f"Сообщение {i}: " + "текст " * (i % 40)}
+                for i in range(args.messages)]
+
+    async def pdf(i):
+        await asyncio.to_thread(generate_pdf, f"bench-{i}", "user0", "Описание проблемы", messages, attachments)
+
+    results.append(await _drive("generate_pdf", pdf, args.pdfs, args.concurrency))
+
+    await app.close_jobs.stop()
+    await app.downloader.close()
+    await app.renderer.close()
+    await server.stop()
+
+    print(f"tickets={args.tickets} concurrency={args.concurrency} messages={args.messages} "
+          f"source={args.source} rest_latency={args.rest_latency}ms format={args.format}")
+    for result in results:
+        _report(result)
+
+    # Разбивка конвейера закрытия по этапам (метрики бота)
+    summary = app.metrics.summary()
+    for (name, labels), h in sorted(summary["histograms"].items()):
+        if name in ("job_stage_seconds", "ticket_step_seconds", "history_fetch_seconds"):
+            print(f"  {name}{{{_labels(labels)}}}: n={h['count']} avg {h['avg'] * 1000:.1f} ms "
+                  f"p99 {h['p99'] * 1000:.1f} ms")
+    for (name, labels), value in sorted(summary["counters"].items()):
+        if name == "job_stage_errors_total":
+            print(f"  {name}{{{_labels(labels)}}}: {value}")
+    print(f"  REST-вызовов: {world.calls}, HTTP-запросов вложений: {server.requests}")
+    print(f"  fetch_member/fetch_user при закрытии: {close_fetches}")
+
+
+def _prepare(tmp: str, args):
+    """Рабочая папка бота: шаблоны, настройки сервера, переменные окружения"""
+    shutil.copytree(os.path.join(PROJECT_DIR, "templates"), os.path.join(tmp, "templates"))
+    guilds_path = os.path.join(tmp, "templates", "guilds.json")
+    with open(guilds_path, encoding="utf-8") as f:
+        guilds = json.load(f)
+    guilds["default"]["transcript_format"] = args.format
+    with open(guilds_path, "w", encoding="utf-8") as f:
+        json.dump(guilds, f, ensure_ascii=False)
+
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+        "GUILDS_CONFIG": guilds_path,
+        "GUILD_ID_1": str(GUILD_ID),
+        "TICKET_CATEGORY_ID": str(CATEGORY_ID),
+        "ADMIN_CHANNEL_ID": str(ADMIN_CHANNEL_ID),
+        "ADMIN_ROLE_ID": str(ADMIN_ROLE_ID),
+        "SUPPORT_ROLE_ID_1": str(SUPPORT_ROLE_ID),
+        "CLOSE_DELETE_DELAY": "0",
+        "METRICS_PORT": "0",
+    })
+    os.chdir(tmp)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickets", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=50, help="разных авторов тикетов")
+    parser.add_argument("--messages", type=int, default=200, help="сообщений в тикете и в PDF")
+    parser.add_argument("--attachment-every", type=int, default=10)
+    parser.add_argument("--images", type=int, default=4, help="разных картинок-вложений")
+    parser.add_argument("--source", choices=("history", "recorded"), default="history")
+    parser.add_argument("--format", default="html", help="формат транскрипта сервера")
+    parser.add_argument("--pdfs", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4, help="воркеров конвейера закрытия")
+    parser.add_argument("--rest-latency", type=float, default=50, help="задержка REST API, мс")
+    parser.add_argument("--timeout", type=float, default=300, help="ожидание конвейера закрытия, с")
+    parser.add_argument("--tracemalloc", action="store_true", help="пик кучи Python вместо RSS (медленнее)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _prepare(tmp, args)
+        asyncio.run(main(args))
+        os.chdir(PROJECT_DIR)
@@ -0,0 +1,68 @@
+"""
+Сравнение пропускной способности записи тикетов:
+commit на каждый create_ticket против объединения записей (database.uow).
+
+    cd project
+    python benchmarks/bench_write_batching.py --tickets 2000 --concurrency 50
+
+База создаётся во временной папке с тем же профилем SQLite, что и у бота,
+но по умолчанию с SQLITE_SYNCHRONOUS=FULL (--synchronous) — чтобы увидеть
+выигрыш при fsync на каждый commit.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+async def _drive(create, tickets: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            ticket = await create(i)
+            assert ticket.id
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(tickets)))
+    return tickets / (time.perf_counter() - started)
+
+
+async def main(args):
+    from database import crud
+    from database.session import engine
+    from database.migrations import run_migrations
+    from database.async_crud import run_db, create_ticket
+
+    run_migrations(engine)
+
+    async def per_call(i):
+        return await run_db(crud.create_ticket, i, f"per-call ticket {i}", "bug", 1)
+
+    async def coalesced(i):
+        return await create_ticket(i, f"coalesced ticket {i}", "bug", 1)
+
+    results = {}
+    for name, create in (("per-call commit", per_call), ("coalesced", coalesced)):
+        await _drive(create, min(100, args.tickets), args.concurrency)  # прогрев
+        results[name] = await _drive(create, args.tickets, args.concurrency)
+        print(f"{name:>16}: {results[name]:8.0f} tickets/s")
+    print(f"{'speedup':>16}: {results['coalesced'] / results['per-call commit']:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickets", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--synchronous", default="FULL", choices=("OFF", "NORMAL", "FULL"))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ["SQLITE_SYNCHRONOUS"] = args.synchronous
+        asyncio.run(main(args))
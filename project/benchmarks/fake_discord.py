@@ -0,0 +1,357 @@
+"""
+Заглушки объектов nextcord для бенчмарков — ровно то, чем пользуются
+обработчики бота: Interaction (response/followup), сервер, категория с
+create_text_channel, текстовый канал с history/send/delete и участники.
+
+Вызовы REST API имитируются задержкой rest_latency; вложения сообщений
+указывают на локальный aiohttp-сервер (AttachmentServer), так что
+загрузчик вложений работает по настоящему HTTP.
+"""
+
+import io
+import asyncio
+import itertools
+from datetime import datetime, timedelta, timezone
+
+import nextcord
+from aiohttp import web
+
+_ids = itertools.count(1)
+
+
+def snowflake(when: datetime = None) -> int:
+    """Уникальный id с временем создания, как у Discord"""
+    when = when or datetime.now(timezone.utc)
+    return nextcord.utils.time_snowflake(when) + next(_ids) % 4096
+
+
+class FakeDiscord:
+    """
+    Кеш «Discord»: каналы, серверы и пользователи по id; patch(bot) подменяет методы бота.
+
+    id принимаются только числами (настоящий API съел бы и строку): строковый
+    id значит, что бот промахнулся мимо своих кешей, — бенчмарк падает на нём.
+    """
+
+    def __init__(self, rest_latency: float = 0.0):
+        self.rest_latency = rest_latency
+        self.channels = {}
+        self.guilds = {}
+        self.users = {}
+        self.calls = 0
+        self.member_fetches = 0
+
+    async def rest(self):
+        self.calls += 1
+        if self.rest_latency:
+            await asyncio.sleep(self.rest_latency)
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    async def fetch_channel(self, channel_id):
+        await self.rest()
+        return self.channels.get(channel_id)
+
+    def get_guild(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    async def fetch_user(self, user_id):
+        await self.rest()
+        self.member_fetches += 1
+        return self.users[user_id]
+
+    def patch(self, bot):
+        bot.get_channel = self.get_channel
+        bot.fetch_channel = self.fetch_channel
+        bot.get_guild = self.get_guild
+        bot.fetch_user = self.fetch_user
+
+    def guild(self, guild_id: int) -> "FakeGuild":
+        guild = self.guilds[guild_id] = FakeGuild(self, guild_id)
+        return guild
+
+    def member(self, guild: "FakeGuild", name: str, roles=()) -> "FakeMember":
+        member = FakeMember(self, guild, snowflake(), name, roles)
+        guild.members[member.id] = member
+        self.users[member.id] = member
+        return member
+
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str):
+        self.id = role_id
+        self.name = name
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+
+class FakeMember:
+    def __init__(self, world, guild, user_id: int, name: str, roles=()):
+        self.world = world
+        self.guild = guild
+        self.id = user_id
+        self.name = self.display_name = name
+        self.mention = f"<@{user_id}>"
+        self._roles = [r.id for r in roles]
+        self.roles = list(roles)
+        self.bot = False
+        self.dms = []
+
+    def __str__(self):
+        return self.name
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+    async def send(self, content=None, **kwargs):
+        await self.world.rest()
+        self.dms.append((content, kwargs))
+
+
+class FakeGuild:
+    def __init__(self, world, guild_id: int):
+        self.world = world
+        self.id = guild_id
+        self.name = f"guild-{guild_id}"
+        self.default_role = FakeRole(guild_id, "@everyone")
+        self.roles = {}
+        self.members = {}
+        self.me = FakeMember(world, self, snowflake(), "bot")
+
+    def role(self, role_id: int, name: str) -> FakeRole:
+        role = self.roles[role_id] = FakeRole(role_id, name)
+        return role
+
+    def category(self, category_id: int) -> "FakeCategory":
+        category = FakeCategory(self, category_id)
+        self.world.channels[category_id] = category
+        return category
+
+    def text_channel(self, channel_id: int, name: str, category=None) -> "FakeTextChannel":
+        channel = FakeTextChannel(self, channel_id, name, category)
+        self.world.channels[channel_id] = channel
+        return channel
+
+    @property
+    def text_channels(self):
+        return [ch for ch in self.world.channels.values()
+                if isinstance(ch, FakeTextChannel) and ch.guild is self]
+
+    def get_role(self, role_id):
+        return self.roles.get(role_id)
+
+    def get_channel(self, channel_id):
+        channel = self.world.channels.get(channel_id)
+        return channel if channel is not None and channel.guild is self else None
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    async def fetch_member(self, user_id):
+        await self.world.rest()
+        self.world.member_fetches += 1
+        return self.members[user_id]
+
+
+class FakeCategory:
+    def __init__(self, guild: FakeGuild, category_id: int):
+        self.guild = guild
+        self.id = category_id
+        self.name = f"category-{category_id}"
+
+    @property
+    def text_channels(self):
+        return [ch for ch in self.guild.text_channels if ch.category is self]
+
+    async def create_text_channel(self, name: str, overwrites=None, **kwargs):
+        await self.guild.world.rest()
+        channel = self.guild.text_channel(snowflake(), name, category=self)
+        channel.overwrites = overwrites or {}
+        return channel
+
+
+class FakeAttachment:
+    def __init__(self, attachment_id: int, filename: str, url: str, size: int):
+        self.id = attachment_id
+        self.filename = filename
+        self.url = url
+        self.size = size
+
+
+class FakeMessage:
+    def __init__(self, channel, author, content: str, attachments=(), created_at: datetime = None):
+        self.created_at = created_at or datetime.now(timezone.utc)
+        self.id = snowflake(self.created_at)
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.attachments = list(attachments)
+        self.edited_at = None
+        self.embeds = []
+
+
+class FakeTextChannel:
+    # Discord отдаёт историю страницами по 100 сообщений, каждая — отдельный запрос
+    HISTORY_PAGE = 100
+
+    def __init__(self, guild: FakeGuild, channel_id: int, name: str, category=None):
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.category = category
+        self.category_id = category.id if category else None
+        self.mention = f"<#{channel_id}>"
+        self.created_at = datetime.now(timezone.utc)
+        self.overwrites = {}
+        self.messages = []
+        self.deleted = False
+
+    async def send(self, content=None, **kwargs):
+        await self.guild.world.rest()
+        message = FakeMessage(self, self.guild.me, content or "", created_at=None)
+        message.embeds = [kwargs["embed"]] if kwargs.get("embed") else []
+        self.messages.append(message)
+        return message
+
+    async def edit(self, name=None, overwrites=None, **kwargs):
+        await self.guild.world.rest()
+        if name is not None:
+            self.name = name
+        if overwrites is not None:
+            self.overwrites = overwrites
+
+    async def delete(self, **kwargs):
+        await self.guild.world.rest()
+        self.deleted = True
+        self.guild.world.channels.pop(self.id, None)
+
+    async def history(self, limit=100, after=None, oldest_first=None, **kwargs):
+        messages = self.messages if oldest_first else self.messages[::-1]
+        if after is not None:
+            messages = [m for m in messages if m.id > after.id]
+        if limit is not None:
+            messages = messages[:limit]
+        for i, message in enumerate(messages):
+            if i % self.HISTORY_PAGE == 0:
+                await self.guild.world.rest()
+            yield message
+
+
+class _Response:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def defer(self, ephemeral: bool = False, **kwargs):
+        self._done = True
+        self._interaction.acked_at = asyncio.get_running_loop().time()
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+        self._interaction.acked_at = asyncio.get_running_loop().time()
+        self._interaction.replies.append(content)
+
+    async def send_modal(self, modal):
+        self._done = True
+        self._interaction.modal = modal
+
+
+class _Followup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        await self._interaction.user.world.rest()
+        self._interaction.replies.append(content)
+
+
+class FakeInteraction:
+    """Нажатие кнопки или отправка формы пользователем user в канале channel"""
+
+    def __init__(self, user: FakeMember, channel=None, custom_id: str = None):
+        self.user = user
+        self.guild = user.guild
+        self.channel = channel
+        self.data = {"custom_id": custom_id} if custom_id else {}
+        self.response = _Response(self)
+        self.followup = _Followup(self)
+        self.replies = []
+        self.modal = None
+        self.acked_at = None
+
+
+def history(channel: FakeTextChannel, authors, count: int, attachment_urls=(), attachment_every: int = 5,
+            age: timedelta = timedelta(hours=1)):
+    """Заполняет канал count сообщениями; каждое attachment_every-е — с вложением из attachment_urls"""
+    start = datetime.now(timezone.utc) - age
+    urls = itertools.cycle(attachment_urls) if attachment_urls else None
+    for i in range(count):
+        atts = []
+        if urls is not None and i % attachment_every == 0:
+            url, size = next(urls)
+            atts.append(FakeAttachment(snowflake(), url.rsplit("/", 1)[1], url, size))
+        channel.messages.append(FakeMessage(
+            channel, authors[i % len(authors)], f"Сообщение {i}: " + "текст " * (i % 40),
+            atts, created_at=start + timedelta(seconds=i)
+        ))
+
+
+def sample_files(images: int = 4, size: int = 512) -> dict:
+    """Набор файлов вложений: images PNG-картинок size×size и текстовый лог"""
+    from PIL import Image
+
+    files = {}
+    for i in range(images):
+        img = Image.effect_noise((size, size), 40 + i * 10).convert("RGB")
+        buf = io.BytesIO()
+        img.save(buf, "PNG")
+        files[f"screenshot_{i}.png"] = buf.getvalue()
+    files["log.txt"] = ("2024-01-01 ERROR something failed\n" * 2000).encode()
+    return files
+
+
+class AttachmentServer:
+    """Локальный HTTP-сервер, отдающий файлы вложений: http://127.0.0.1:<port>/<имя>"""
+
+    def __init__(self, files: dict):
+        self.files = files
+        self.requests = 0
+        self._runner = None
+        self.base_url = None
+
+    async def _handle(self, request):
+        self.requests += 1
+        body = self.files.get(request.match_info["name"])
+        if body is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=body)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/{name}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self
+
+    def urls(self) -> list:
+        """[(url, size)] всех файлов"""
+        return [(f"{self.base_url}/{name}", len(body)) for name, body in self.files.items()]
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
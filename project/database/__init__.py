@@ -1,4 +1,4 @@
-from .models import Base, Ticket, Feedback
+from .models import Base, Ticket, Feedback, TranscriptMessage, Job, Blob, TicketAttachment
 from .session import engine, SessionLocal
 
-__all__ = ["Base", "Ticket", "Feedback", "engine", "SessionLocal"]
\ No newline at end of file
+__all__ = ["Base", "Ticket", "Feedback", "TranscriptMessage", "Job", "Blob", "TicketAttachment", "engine", "SessionLocal"]
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""
+Асинхронная обёртка над database.crud.
+
+Все обращения к БД выполняются в отдельном потоке-воркере, поэтому
+медленный commit/fsync SQLite больше не блокирует event loop nextcord.
+Функции повторяют API crud, но без аргумента db — сессия открывается
+и закрывается внутри воркера. Записи, пришедшие почти одновременно,
+объединяются в одну транзакцию (см. database.uow).
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from config import Config
+from . import crud
+from .session import SessionLocal
+from .stats import StatsEngine
+from .uow import WriteCoalescer
+
+# SQLite всё равно сериализует запись, поэтому одного потока достаточно:
+# запросы выполняются строго по очереди и не конкурируют за блокировку файла.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+
+# Счётчики обновляются в том же потоке сразу после записи, поэтому
+# не могут разойтись с первоначальной загрузкой
+stats = StatsEngine(legacy_guild=Config.STATS_LEGACY_GUILD_ID)
+
+_writes = WriteCoalescer(
+    _executor, SessionLocal,
+    window=Config.DB_WRITE_WINDOW_MS / 1000,
+    max_batch=Config.DB_WRITE_BATCH
+)
+
+
+def _call(fn, *args, **kwargs):
+    # expire_on_commit=False: объекты остаются читаемыми после закрытия сессии
+    with SessionLocal(expire_on_commit=False) as db:
+        return fn(db, *args, **kwargs)
+
+
+async def run_db(fn, *args, **kwargs):
+    """Выполняет fn(db, *args, **kwargs) в потоке БД и возвращает результат"""
+    # Сначала отправляем накопленные записи, чтобы запрос их увидел
+    _writes.flush()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(_call, fn, *args, **kwargs))
+
+
+async def get_statistics(guild_id=None, days: int = 7):
+    """Статистика из инкрементальных счётчиков (при первом вызове — загрузка из БД)"""
+    if stats.stale(Config.STATS_MAX_AGE):
+        await run_db(stats.load)
+    return stats.snapshot(str(guild_id) if guild_id else None, days)
+
+async def get_ticket(ticket_id: int):
+    return await run_db(crud.get_ticket, ticket_id)
+
+async def get_ticket_by_channel(channel_id: int):
+    return await run_db(crud.get_ticket_by_channel, channel_id)
+
+async def set_ticket_channel(ticket_id: int, channel_id: int):
+    return await _writes.submit(crud.set_ticket_channel, ticket_id, channel_id, False)
+
+async def find_duplicate_ticket(user_id: str, guild_id: str, content: str, window: timedelta):
+    return await run_db(crud.find_duplicate_ticket, user_id, guild_id, content, window)
+
+def _close_ticket(db, ticket_id):
+    ticket = crud.get_ticket(db, ticket_id)
+    was_open = ticket is not None and ticket.status == "open"
+    if was_open:
+        crud.close_ticket(db, ticket_id, commit=False)
+    return ticket, was_open
+
+def _ticket_closed(result):
+    ticket, was_open = result
+    if was_open:
+        stats.ticket_closed(ticket)
+
+
+async def create_ticket(user_id: str, content: str, tag: str, guild_id: str = None,
+                        channel_id: int = None):
+    return await _writes.submit(crud.create_ticket, user_id, content, tag, guild_id, channel_id, False,
+                                on_commit=stats.ticket_created)
+
+async def close_ticket(ticket_id: int):
+    """(тикет или None, был ли он открыт) — закрывает тикет только один раз"""
+    return await _writes.submit(_close_ticket, ticket_id, on_commit=_ticket_closed)
+
+async def create_feedback(user_id: str, rating: int, ticket_id: int, comment: str = None,
+                          guild_id=None):
+    """guild_id — сервер тикета (для !stats): сам тикет ради него не загружается"""
+    def created(feedback):
+        if feedback:
+            stats.feedback_created(feedback, str(guild_id) if guild_id else None)
+
+    return await _writes.submit(crud.create_feedback, user_id, rating, ticket_id, comment, False,
+                                on_commit=created)
+
+async def record_messages(records: list):
+    return await _writes.submit(crud.record_messages, records, False)
+
+async def update_message(message_id: int, content: str, attachments: str, edited_at: datetime):
+    return await _writes.submit(crud.update_message, message_id, content, attachments, edited_at, False)
+
+async def delete_message(message_id: int):
+    return await _writes.submit(crud.delete_message, message_id, False)
+
+async def get_last_message_id(channel_id: int, before_id: int = None):
+    return await run_db(crud.get_last_message_id, channel_id, before_id)
+
+async def purge_channel_messages(channel_id: int):
+    return await _writes.submit(crud.purge_channel_messages, channel_id, False)
+
+async def enqueue_job(kind: str, stage: str, payload: str):
+    return await _writes.submit(crud.enqueue_job, kind, stage, payload, False)
+
+async def claim_job(kind: str, lease: float):
+    return await _writes.submit(crud.claim_job, kind, lease, False)
+
+async def save_job(job_id: int, **fields):
+    return await _writes.submit(functools.partial(crud.save_job, commit=False, **fields), job_id)
+
+async def renew_job_lease(job_id: int, lease: float):
+    return await _writes.submit(crud.renew_job_lease, job_id, lease, False)
+
+async def find_attachment_blob(attachment_id: int):
+    return await run_db(crud.find_attachment_blob, attachment_id)
+
+async def put_blob(sha256: str, size: int, ext: str):
+    return await _writes.submit(crud.put_blob, sha256, size, ext, False)
+
+async def link_attachment(ticket_id: int, attachment_id: int, sha256: str, filename: str, url: str):
+    return await _writes.submit(crud.link_attachment, ticket_id, attachment_id, sha256, filename, url, False)
+
+async def blob_usage():
+    return await run_db(crud.blob_usage)
+
+async def expire_attachments(closed_before: datetime):
+    return await _writes.submit(crud.expire_attachments, closed_before, False)
+
+async def orphan_blobs(idle_before: datetime, limit: int = 500):
+    return await run_db(crud.orphan_blobs, idle_before, limit)
+
+async def delete_blobs(hashes: list):
+    return await _writes.submit(crud.delete_blobs, hashes, False)
+
+
+def shutdown():
+    """Дожидается завершения запросов в очереди и останавливает поток БД"""
+    _executor.shutdown(wait=True)
@@ -1,54 +1,259 @@
+import hashlib
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from .models import Ticket, Feedback
-from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import func, case, distinct, and_, or_
+from .models import Ticket, Feedback, TranscriptMessage, Job, Blob, TicketAttachment
+from datetime import datetime, timedelta
+
+
+def content_fingerprint(content: str) -> str:
+    """SHA-256 от текста без учёта регистра и лишних пробелов"""
+    normalized = " ".join(content.casefold().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
 
 def get_statistics(db: Session):
-    """Возвращает статистику по тикетам и отзывам"""
-    stats = {
-        "total_tickets": db.query(Ticket).count(),
-        "open_tickets": db.query(Ticket).filter(Ticket.status == "open").count(),
-        "avg_rating": db.query(func.avg(Feedback.rating)).scalar() or 0.0
-    }
-    return stats
-
-def create_ticket(db: Session, user_id: str, content: str, tag: str):
+    """Возвращает статистику по тикетам и отзывам (одним запросом)"""
+    total, open_, avg = db.query(
+        func.count(distinct(Ticket.id)),
+        func.count(distinct(case((Ticket.status == "open", Ticket.id)))),
+        func.avg(Feedback.rating)
+    ).outerjoin(Feedback, Feedback.ticket_id == Ticket.id).one()
+    return {"total_tickets": total, "open_tickets": open_, "avg_rating": avg or 0.0}
+
+def get_ticket(db: Session, ticket_id: int):
+    return db.query(Ticket).filter(Ticket.id == ticket_id).first()
+
+def get_ticket_by_channel(db: Session, channel_id: int):
+    return db.query(Ticket).filter(Ticket.channel_id == channel_id).first()
+
+def set_ticket_channel(db: Session, ticket_id: int, channel_id: int, commit: bool = True):
+    db.query(Ticket).filter(Ticket.id == ticket_id).update({"channel_id": channel_id})
+    if commit:
+        db.commit()
+
+def find_duplicate_ticket(db: Session, user_id: str, guild_id: str, content: str, window: timedelta):
+    """
+    Ищет тикет того же пользователя на том же сервере с таким же текстом,
+    созданный не раньше чем window назад. Поиск идёт по индексу content_hash.
+    """
+    return db.query(Ticket).filter(
+        Ticket.content_hash == content_fingerprint(content),
+        Ticket.user_id == str(user_id),
+        Ticket.guild_id == str(guild_id),
+        Ticket.created_at >= datetime.now() - window
+    ).first()
+
+# Функции записи принимают commit=False, чтобы их можно было объединять
+# в одну транзакцию (см. database.uow) — тогда вместо commit делается flush.
+
+def create_ticket(db: Session, user_id: str, content: str, tag: str, guild_id: str = None,
+                  channel_id: int = None, commit: bool = True):
     new_ticket = Ticket(
-        user_id=user_id,
+        user_id=str(user_id),
+        guild_id=str(guild_id) if guild_id else None,
+        channel_id=channel_id,
         content=content,
+        content_hash=content_fingerprint(content),
         tag=tag,
         created_at=datetime.now()
     )
     db.add(new_ticket)
-    db.commit()
-    db.refresh(new_ticket)
+    if commit:
+        db.commit()
+        db.refresh(new_ticket)
+    else:
+        db.flush()
     return new_ticket
 
-def close_ticket(db: Session, ticket_id: int):
+def close_ticket(db: Session, ticket_id: int, commit: bool = True):
     ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
     if ticket:
         ticket.status = "closed"
         ticket.closed_at = datetime.now()
-        db.commit()
+        if commit:
+            db.commit()
     return ticket
 
-def create_feedback(db: Session, user_id: str, rating: int, ticket_id: int, comment: str = None):
+def create_feedback(db: Session, user_id: str, rating: int, ticket_id: int, comment: str = None,
+                    commit: bool = True):
     """
     Привязывает отзыв к конкретному тикету. 
-    Если отзыв уже есть для этого ticket_id, возвращает None.
+    Если отзыв уже есть для этого ticket_id, возвращает None
+    (срабатывает уникальный индекс ux_feedbacks_ticket_id).
     """
-    existing = db.query(Feedback).filter(Feedback.ticket_id == ticket_id).first()
-    if existing:
-        return None
-
     feedback = Feedback(
-        user_id=user_id,
+        user_id=str(user_id),
         rating=rating,
         comment=comment,
         created_at=datetime.now(),
         ticket_id=ticket_id
     )
+    if not commit:
+        # Откатываем только этот отзыв, не всю общую транзакцию
+        try:
+            with db.begin_nested():
+                db.add(feedback)
+        except IntegrityError:
+            return None
+        return feedback
+
     db.add(feedback)
-    db.commit()
-    db.refresh(feedback)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
     return feedback
+
+def record_messages(db: Session, records: list, commit: bool = True):
+    """Сохраняет (или перезаписывает) сообщения каналов тикетов"""
+    for record in records:
+        db.merge(TranscriptMessage(**record))
+    if commit:
+        db.commit()
+
+def update_message(db: Session, message_id: int, content: str, attachments: str, edited_at: datetime,
+                   commit: bool = True):
+    db.query(TranscriptMessage).filter(TranscriptMessage.message_id == message_id).update(
+        {"content": content, "attachments": attachments, "edited_at": edited_at}
+    )
+    if commit:
+        db.commit()
+
+def delete_message(db: Session, message_id: int, commit: bool = True):
+    db.query(TranscriptMessage).filter(TranscriptMessage.message_id == message_id).delete()
+    if commit:
+        db.commit()
+
+def get_last_message_id(db: Session, channel_id: int, before_id: int = None):
+    """Последний записанный id сообщения канала (строго меньше before_id, если задан)"""
+    query = db.query(func.max(TranscriptMessage.message_id)).filter(
+        TranscriptMessage.channel_id == channel_id
+    )
+    if before_id is not None:
+        query = query.filter(TranscriptMessage.message_id < before_id)
+    return query.scalar()
+
+def iter_channel_messages(db: Session, channel_id: int):
+    """Сообщения канала в хронологическом порядке, порциями из БД"""
+    return db.query(TranscriptMessage).filter(
+        TranscriptMessage.channel_id == channel_id
+    ).order_by(TranscriptMessage.message_id).yield_per(500)
+
+def purge_channel_messages(db: Session, channel_id: int, commit: bool = True):
+    db.query(TranscriptMessage).filter(TranscriptMessage.channel_id == channel_id).delete()
+    if commit:
+        db.commit()
+
+def enqueue_job(db: Session, kind: str, stage: str, payload: str, commit: bool = True):
+    now = datetime.now()
+    job = Job(kind=kind, stage=stage, status="pending", attempts=0, payload=payload,
+              next_run_at=now, created_at=now, updated_at=now)
+    db.add(job)
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+    return job
+
+def _claimable(kind: str, now: datetime):
+    # Готовые pending-задачи и running-задачи, чей воркер пропал (аренда истекла)
+    return and_(Job.kind == kind, or_(
+        and_(Job.status == "pending", Job.next_run_at <= now),
+        and_(Job.status == "running", or_(Job.lease_until.is_(None), Job.lease_until < now)),
+    ))
+
+def claim_job(db: Session, kind: str, lease: float, commit: bool = True):
+    """
+    Забирает ближайшую готовую к запуску задачу (→ running) с арендой на lease секунд.
+    Условный UPDATE не даст двум процессам забрать одну и ту же задачу; задачу
+    упавшего или перезапущенного процесса забирают после истечения её аренды.
+    """
+    now = datetime.now()
+    candidates = db.query(Job.id).filter(_claimable(kind, now)).order_by(
+        Job.next_run_at, Job.id
+    ).limit(5).all()
+    for (job_id,) in candidates:
+        claimed = db.query(Job).filter(Job.id == job_id, _claimable(kind, now)).update(
+            {"status": "running", "lease_until": now + timedelta(seconds=lease), "updated_at": now},
+            synchronize_session=False
+        )
+        if claimed:
+            if commit:
+                db.commit()
+            return db.query(Job).filter(Job.id == job_id).first()
+    return None
+
+def save_job(db: Session, job_id: int, commit: bool = True, **fields):
+    fields["updated_at"] = datetime.now()
+    db.query(Job).filter(Job.id == job_id).update(fields)
+    if commit:
+        db.commit()
+
+def renew_job_lease(db: Session, job_id: int, lease: float, commit: bool = True):
+    """Продлевает аренду выполняющейся задачи"""
+    db.query(Job).filter(Job.id == job_id, Job.status == "running").update(
+        {"lease_until": datetime.now() + timedelta(seconds=lease)}, synchronize_session=False
+    )
+    if commit:
+        db.commit()
+
+# ─── Хранилище вложений ───────────────────────────────────────────────────
+def find_attachment_blob(db: Session, attachment_id: int):
+    """Blob, уже скачанный для этого вложения (в любом тикете), или None"""
+    return db.query(Blob).join(TicketAttachment, TicketAttachment.sha256 == Blob.sha256).filter(
+        TicketAttachment.attachment_id == attachment_id
+    ).first()
+
+def put_blob(db: Session, sha256: str, size: int, ext: str, commit: bool = True) -> tuple:
+    """Регистрирует blob; возвращает (blob, создан ли новый)"""
+    now = datetime.now()
+    blob = db.query(Blob).filter(Blob.sha256 == sha256).first()
+    created = blob is None
+    if created:
+        blob = Blob(sha256=sha256, size=size, ext=ext, created_at=now)
+        db.add(blob)
+    blob.last_used_at = now
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+    return blob, created
+
+def link_attachment(db: Session, ticket_id: int, attachment_id: int, sha256: str,
+                    filename: str, url: str, commit: bool = True):
+    exists = db.query(TicketAttachment.id).filter(
+        TicketAttachment.ticket_id == ticket_id, TicketAttachment.attachment_id == attachment_id
+    ).first()
+    if not exists:
+        db.add(TicketAttachment(ticket_id=ticket_id, attachment_id=attachment_id, sha256=sha256,
+                                filename=filename, url=url, created_at=datetime.now()))
+    db.query(Blob).filter(Blob.sha256 == sha256).update({"last_used_at": datetime.now()})
+    if commit:
+        db.commit()
+
+def blob_usage(db: Session) -> int:
+    return db.query(func.coalesce(func.sum(Blob.size), 0)).scalar()
+
+def expire_attachments(db: Session, closed_before: datetime, commit: bool = True) -> int:
+    """Удаляет ссылки на вложения тикетов, закрытых раньше closed_before"""
+    expired = db.query(Ticket.id).filter(Ticket.status == "closed", Ticket.closed_at < closed_before)
+    count = db.query(TicketAttachment).filter(
+        TicketAttachment.ticket_id.in_(expired.scalar_subquery())
+    ).delete(synchronize_session=False)
+    if commit:
+        db.commit()
+    return count
+
+def orphan_blobs(db: Session, idle_before: datetime, limit: int = 500) -> list:
+    """Blob-ы без ссылок, не использовавшиеся с idle_before"""
+    referenced = db.query(TicketAttachment.sha256)
+    return db.query(Blob).filter(
+        Blob.last_used_at < idle_before, ~Blob.sha256.in_(referenced.scalar_subquery())
+    ).limit(limit).all()
+
+def delete_blobs(db: Session, hashes: list, commit: bool = True) -> int:
+    count = db.query(Blob).filter(Blob.sha256.in_(hashes)).delete(synchronize_session=False)
+    if commit:
+        db.commit()
+    return count
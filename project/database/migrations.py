@@ -0,0 +1,110 @@
+"""
+Версионные миграции схемы.
+
+run_migrations() вызывается при старте вместо Base.metadata.create_all:
+сначала создаются недостающие таблицы (сразу в актуальной схеме), затем
+по порядку применяются шаги с версией больше записанной в schema_version.
+Шаги идемпотентны — их можно применять и к базам, созданным create_all.
+
+Чтобы изменить схему, добавьте функцию-шаг в конец MIGRATIONS.
+"""
+
+from sqlalchemy import inspect, text
+
+from .models import Base
+from .crud import content_fingerprint
+
+BACKFILL_BATCH = 500
+
+
+def _columns(conn, table: str) -> set:
+    return {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def _add_column(conn, table: str, column: str, ddl: str):
+    if column not in _columns(conn, table):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _create_index(conn, name: str, table: str, columns: str, unique: bool = False):
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    conn.execute(text(f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+# ─── шаги ─────────────────────────────────────────────────────────────────
+def _001_ticket_fingerprints(conn):
+    """guild_id и content_hash у тикетов, заполнение отпечатков старых строк"""
+    _add_column(conn, "tickets", "guild_id", "VARCHAR(50)")
+    _add_column(conn, "tickets", "content_hash", "VARCHAR(64)")
+    _create_index(conn, "ix_tickets_content_hash", "tickets", "content_hash")
+    while True:
+        rows = conn.execute(
+            text("SELECT id, content FROM tickets WHERE content_hash IS NULL LIMIT :n"),
+            {"n": BACKFILL_BATCH}
+        ).fetchall()
+        if not rows:
+            return
+        conn.execute(
+            text("UPDATE tickets SET content_hash = :h WHERE id = :id"),
+            [{"id": r.id, "h": content_fingerprint(r.content)} for r in rows]
+        )
+
+
+def _002_ticket_channel(conn):
+    """channel_id у тикетов"""
+    _add_column(conn, "tickets", "channel_id", "BIGINT")
+    _create_index(conn, "ix_tickets_channel_id", "tickets", "channel_id")
+
+
+def _003_ticket_indexes(conn):
+    """Индексы под выборки по пользователю, серверу, статусу, тегу и дате"""
+    _create_index(conn, "ix_tickets_user_created", "tickets", "user_id, created_at")
+    _create_index(conn, "ix_tickets_guild_status", "tickets", "guild_id, status")
+    _create_index(conn, "ix_tickets_guild_tag", "tickets", "guild_id, tag")
+    _create_index(conn, "ix_tickets_status", "tickets", "status")
+    _create_index(conn, "ix_tickets_created_at", "tickets", "created_at")
+
+
+def _004_unique_feedback(conn):
+    """Один отзыв на тикет: удаляем дубликаты (оставляя первый) и ставим уникальный индекс"""
+    conn.execute(text(
+        "DELETE FROM feedbacks WHERE id NOT IN "
+        "(SELECT MIN(id) FROM feedbacks GROUP BY ticket_id)"
+    ))
+    _create_index(conn, "ux_feedbacks_ticket_id", "feedbacks", "ticket_id", unique=True)
+
+
+def _005_job_leases(conn):
+    """Аренда у фоновых задач: running-задачи другого процесса не перезапускаются"""
+    _add_column(conn, "jobs", "lease_until", "DATETIME")
+
+
+MIGRATIONS = [
+    _001_ticket_fingerprints,
+    _002_ticket_channel,
+    _003_ticket_indexes,
+    _004_unique_feedback,
+    _005_job_leases,
+]
+
+
+def get_version(conn) -> int:
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+    return version or 0
+
+
+def run_migrations(engine) -> int:
+    """Приводит схему к последней версии и возвращает её номер"""
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        version = get_version(conn)
+    for number, step in enumerate(MIGRATIONS, start=1):
+        if number <= version:
+            continue
+        # Каждый шаг — в своей транзакции вместе с записью версии
+        with engine.begin() as conn:
+            step(conn)
+            conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {"v": number})
+        print(f"[DB] migration {number:03d} applied: {step.__doc__.strip()}")
+    return len(MIGRATIONS)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
@@ -6,10 +6,21 @@ Base = declarative_base()
 class Ticket(Base):
     """Модель для хранения тикетов"""
     __tablename__ = "tickets"
+    __table_args__ = (
+        Index("ix_tickets_user_created", "user_id", "created_at"),
+        Index("ix_tickets_guild_status", "guild_id", "status"),
+        Index("ix_tickets_guild_tag", "guild_id", "tag"),
+        Index("ix_tickets_status", "status"),
+        Index("ix_tickets_created_at", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(String(50), nullable=False)
+    guild_id = Column(String(50))
+    channel_id = Column(BigInteger, index=True)
     content = Column(String(1000), nullable=False)
+    # Отпечаток нормализованного текста — для быстрого поиска дубликатов
+    content_hash = Column(String(64), index=True)
     status = Column(String(20), default="open")
     created_at = Column(DateTime)
     closed_at = Column(DateTime)
@@ -20,6 +31,10 @@ class Ticket(Base):
 class Feedback(Base):
     """Модель для хранения отзывов"""
     __tablename__ = "feedbacks"
+    __table_args__ = (
+        # Один отзыв на тикет — гарантируется ограничением, а не проверкой в коде
+        Index("ux_feedbacks_ticket_id", "ticket_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(String(50), nullable=False)
@@ -41,3 +56,64 @@ class Tag(Base):
 
     def __repr__(self):
         return f"{self.emoji} {self.name}"
+
+class TranscriptMessage(Base):
+    """Сообщения из каналов тикетов, записанные по мере поступления"""
+    __tablename__ = "transcript_messages"
+
+    message_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    channel_id = Column(BigInteger, nullable=False, index=True)
+    author = Column(String(100), nullable=False)
+    content = Column(Text, nullable=False, default="")
+    # JSON-список [id, filename, url, size] для каждого вложения
+    attachments = Column(Text, nullable=False, default="[]")
+    created_at = Column(DateTime)
+    edited_at = Column(DateTime)
+
+class Job(Base):
+    """Фоновая задача из нескольких этапов (например, закрытие тикета)"""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_kind_status_run", "kind", "status", "next_run_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(30), nullable=False)
+    stage = Column(String(30), nullable=False)
+    # pending → running → done | failed
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    payload = Column(Text, nullable=False, default="{}")
+    last_error = Column(Text)
+    next_run_at = Column(DateTime, nullable=False)
+    # Аренда running-задачи: воркер продлевает её, пока выполняет этап;
+    # истёкшая аренда значит, что процесс упал, и задачу может забрать другой
+    lease_until = Column(DateTime)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
+class Blob(Base):
+    """Файл в хранилище вложений: один на уникальное содержимое (sha256)"""
+    __tablename__ = "blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    # Расширение исходного файла — по нему экспорт определяет тип вложения
+    ext = Column(String(16), nullable=False, default="")
+    created_at = Column(DateTime)
+    last_used_at = Column(DateTime, index=True)
+
+class TicketAttachment(Base):
+    """Вложение тикета — ссылка на blob по хешу содержимого"""
+    __tablename__ = "ticket_attachments"
+    __table_args__ = (
+        Index("ux_ticket_attachments_ticket_att", "ticket_id", "attachment_id", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    ticket_id = Column(Integer, ForeignKey('tickets.id'), nullable=False)
+    attachment_id = Column(BigInteger, nullable=False, index=True)
+    sha256 = Column(String(64), ForeignKey('blobs.sha256'), nullable=False, index=True)
+    filename = Column(String(255), nullable=False)
+    url = Column(Text)
+    created_at = Column(DateTime)
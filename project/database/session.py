@@ -1,11 +1,73 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./tickets.db"
+from config import Config
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+SQLALCHEMY_DATABASE_URL = Config.DATABASE_URL
+
+
+def sqlite_pragmas(in_memory: bool = False) -> dict:
+    """
+    Профиль SQLite для бота: WAL (читатели не ждут писателя), synchronous=NORMAL
+    (в WAL это безопасно при сбое процесса — fsync только на checkpoint),
+    mmap для чтения без копирования, busy_timeout вместо мгновенного «database is locked».
+    """
+    pragmas = {
+        "synchronous": Config.SQLITE_SYNCHRONOUS,
+        "busy_timeout": Config.SQLITE_BUSY_TIMEOUT_MS,
+        "temp_store": "MEMORY",
+        "cache_size": -20000,  # ~20 МБ на соединение
+    }
+    if not in_memory:
+        pragmas["journal_mode"] = "WAL"
+        pragmas["mmap_size"] = Config.SQLITE_MMAP_MB * 1024 * 1024
+    return pragmas
+
+
+def make_engine(url: str = SQLALCHEMY_DATABASE_URL):
+    """Создаёт engine под нужный бэкенд (SQLite или PostgreSQL) с настройками пула"""
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        in_memory = url.database in (None, "", ":memory:")
+        engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False},
+            # Для файловой базы — пул соединений под параллельных читателей;
+            # база в памяти живёт в одном соединении, общем для всех потоков
+            # (миграции идут в основном потоке, запросы — в потоке БД)
+            **({"poolclass": StaticPool} if in_memory else {"pool_size": Config.DB_POOL_SIZE,
+                                                            "max_overflow": Config.DB_MAX_OVERFLOW})
+        )
+        pragmas = sqlite_pragmas(in_memory)
+
+        @event.listens_for(engine, "connect")
+        def _apply_pragmas(dbapi_conn, _record):
+            # pysqlite сам не шлёт BEGIN, и SAVEPOINT вне транзакции коммитится
+            # при RELEASE — транзакцию начинаем явно (рецепт SQLAlchemy для pysqlite)
+            dbapi_conn.isolation_level = None
+            cursor = dbapi_conn.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+        @event.listens_for(engine, "begin")
+        def _begin(conn):
+            conn.exec_driver_sql("BEGIN")
+
+        return engine
+
+    return create_engine(
+        url,
+        pool_size=Config.DB_POOL_SIZE,
+        max_overflow=Config.DB_MAX_OVERFLOW,
+        pool_pre_ping=True,     # отбрасывать соединения, закрытые сервером
+        pool_recycle=1800,
+    )
+
+
+engine = make_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
@@ -0,0 +1,211 @@
+"""
+Статистика тикетов, которая поддерживается инкрементально.
+
+При первом обращении счётчики заполняются двумя сгруппированными запросами
+(счётчики и гистограмма длительностей закрытых тикетов), дальше их
+обновляют create_ticket/close_ticket/create_feedback из database.async_crud.
+Чтение статистики не обращается к БД, а память и время обновления не
+зависят от размера таблицы: медиана времени до закрытия — приближённая,
+по корзинам гистограммы (погрешность до ~10%).
+"""
+
+import time
+import bisect
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+
+from sqlalchemy import func, case, distinct
+
+from .models import Ticket, Feedback
+
+
+# Границы корзин длительности (сек): геометрическая сетка с шагом 20%
+# от 10 секунд до года; последняя корзина — всё, что дольше
+_BOUNDS = [10 * 1.2 ** i for i in range(84)]
+
+
+def _bucket(seconds: float) -> int:
+    return bisect.bisect_right(_BOUNDS, seconds)
+
+
+def _median(counts: list):
+    """Медиана по гистограмме: среднее геометрическое границ корзины с медианой"""
+    total = sum(counts)
+    if not total:
+        return None
+    seen = 0
+    for i, count in enumerate(counts):
+        seen += count
+        if seen * 2 >= total:
+            break
+    if i == 0:
+        return _BOUNDS[0] / 2
+    if i == len(_BOUNDS):
+        return _BOUNDS[-1]
+    return (_BOUNDS[i - 1] * _BOUNDS[i]) ** 0.5
+
+
+def _duration(dialect: str, start, end):
+    """Длительность end - start в секундах выражением SQL"""
+    if dialect == "sqlite":
+        return (func.julianday(end) - func.julianday(start)) * 86400
+    return func.extract("epoch", end - start)
+
+
+def _day(value) -> date:
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value.date() if hasattr(value, "date") else value
+
+
+# Ключ для сумм по всем серверам сразу
+ALL = "*"
+
+
+class StatsEngine:
+    """
+    legacy_guild — сервер, к которому относятся тикеты без guild_id (созданные
+    до его появления в схеме). Если не задан, они видны только в сумме по
+    всем серверам, а snapshot сервера сообщает их число в unassigned_tickets.
+    """
+
+    def __init__(self, legacy_guild: str = None):
+        self.legacy_guild = legacy_guild or None
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.loaded_at = 0.0
+        self._reset()
+
+    def _reset(self):
+        # (guild_id, tag) -> [всего, открытых]
+        self._tickets = defaultdict(lambda: [0, 0])
+        # (guild_id, день создания) -> число тикетов
+        self._days = defaultdict(int)
+        # guild_id -> [сумма оценок, число отзывов]
+        self._ratings = defaultdict(lambda: [0, 0])
+        # guild_id -> гистограмма длительностей закрытых тикетов (корзины _BOUNDS)
+        self._durations = defaultdict(lambda: [0] * (len(_BOUNDS) + 1))
+
+    def _guild(self, guild_id):
+        return guild_id if guild_id is not None else self.legacy_guild
+
+    # ─── загрузка (в потоке БД) ───────────────────────────────────────────
+    def load(self, db):
+        rows = db.query(
+            Ticket.guild_id,
+            Ticket.tag,
+            func.date(Ticket.created_at),
+            func.count(distinct(Ticket.id)),
+            func.count(distinct(case((Ticket.status == "open", Ticket.id)))),
+            func.count(Feedback.id),
+            func.coalesce(func.sum(Feedback.rating), 0),
+        ).outerjoin(Feedback, Feedback.ticket_id == Ticket.id).group_by(
+            Ticket.guild_id, Ticket.tag, func.date(Ticket.created_at)
+        ).all()
+        durations = db.query(
+            Ticket.guild_id,
+            _duration(db.get_bind().dialect.name, Ticket.created_at, Ticket.closed_at).label("seconds"),
+        ).filter(
+            Ticket.status == "closed", Ticket.closed_at.isnot(None), Ticket.created_at.isnot(None)
+        ).subquery()
+        bucket = case(*((durations.c.seconds < b, i) for i, b in enumerate(_BOUNDS)), else_=len(_BOUNDS))
+        closed = db.query(durations.c.guild_id, bucket, func.count()).group_by(
+            durations.c.guild_id, bucket
+        ).all()
+
+        with self._lock:
+            self._reset()
+            for guild_id, tag, day, total, open_, fb_count, fb_sum in rows:
+                guild_id = self._guild(guild_id)
+                counter = self._tickets[(guild_id, tag)]
+                counter[0] += total
+                counter[1] += open_
+                for key in (guild_id, ALL):
+                    if day:
+                        self._days[(key, _day(day))] += total
+                    self._ratings[key][0] += fb_sum
+                    self._ratings[key][1] += fb_count
+            for guild_id, index, count in closed:
+                for key in (self._guild(guild_id), ALL):
+                    self._durations[key][index] += count
+            self.loaded = True
+            self.loaded_at = time.monotonic()
+
+    def stale(self, max_age: float) -> bool:
+        """
+        Нужна ли перезагрузка. Счётчики видят только записи своего процесса,
+        поэтому при нескольких процессах бота их перечитывают раз в max_age секунд
+        (0 — только при первом обращении).
+        """
+        return not self.loaded or bool(max_age) and time.monotonic() - self.loaded_at > max_age
+
+    # ─── инкрементальные обновления (в потоке БД, после commit) ───────────
+    def ticket_created(self, ticket):
+        if not self.loaded:
+            return
+        guild_id = self._guild(ticket.guild_id)
+        with self._lock:
+            counter = self._tickets[(guild_id, ticket.tag)]
+            counter[0] += 1
+            counter[1] += 1
+            for key in (guild_id, ALL):
+                self._days[(key, _day(ticket.created_at))] += 1
+
+    def ticket_closed(self, ticket):
+        if not self.loaded:
+            return
+        guild_id = self._guild(ticket.guild_id)
+        with self._lock:
+            self._tickets[(guild_id, ticket.tag)][1] -= 1
+            if ticket.created_at and ticket.closed_at:
+                index = _bucket((ticket.closed_at - ticket.created_at).total_seconds())
+                for key in (guild_id, ALL):
+                    self._durations[key][index] += 1
+
+    def feedback_created(self, feedback, guild_id):
+        if not self.loaded:
+            return
+        guild_id = self._guild(guild_id)
+        with self._lock:
+            for key in (guild_id, ALL):
+                self._ratings[key][0] += feedback.rating
+                self._ratings[key][1] += 1
+
+    # ─── чтение ───────────────────────────────────────────────────────────
+    def snapshot(self, guild_id: str = None, days: int = 7) -> dict:
+        """
+        Статистика сервера (или всех серверов, если guild_id не задан):
+        всего/открыто, средняя оценка, медиана времени до закрытия,
+        разбивка по тегам и число тикетов за последние days дней.
+        unassigned_tickets — тикеты без сервера, не вошедшие в статистику сервера.
+        """
+        key = ALL if guild_id is None else guild_id
+        with self._lock:
+            # Пар (сервер, тег) немного — перебор не зависит от числа тикетов
+            by_tag = defaultdict(lambda: {"total": 0, "open": 0})
+            unassigned = 0
+            for (gid, tag), (total, open_) in self._tickets.items():
+                if gid is None and guild_id is not None:
+                    unassigned += total
+                if guild_id is None or gid == guild_id:
+                    by_tag[tag or "—"]["total"] += total
+                    by_tag[tag or "—"]["open"] += open_
+
+            fb_sum, fb_count = self._ratings.get(key, (0, 0))
+            median = _median(self._durations.get(key, ()))
+            today = date.today()
+            by_day = {
+                today - timedelta(days=i): self._days.get((key, today - timedelta(days=i)), 0)
+                for i in range(days)
+            }
+
+        return {
+            "total_tickets": sum(t["total"] for t in by_tag.values()),
+            "open_tickets": sum(t["open"] for t in by_tag.values()),
+            "avg_rating": fb_sum / fb_count if fb_count else 0.0,
+            "median_close_seconds": median,
+            "by_tag": dict(by_tag),
+            "by_day": by_day,
+            "unassigned_tickets": unassigned,
+        }
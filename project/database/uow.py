@@ -0,0 +1,84 @@
+"""
+Объединение записей в транзакции (unit of work).
+
+Записи, пришедшие в течение window секунд (или до max_batch штук), выполняются
+в потоке БД одной транзакцией: каждая в своём SAVEPOINT, затем один commit.
+Ошибка одной записи откатывает только её savepoint; каждый вызывающий
+получает свой результат (например, объект тикета с присвоенным id).
+"""
+
+import asyncio
+import functools
+import traceback
+
+
+class WriteCoalescer:
+    def __init__(self, executor, session_factory, window: float = 0.005, max_batch: int = 100):
+        self.executor = executor
+        self.session_factory = session_factory
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+
+    async def submit(self, fn, *args, on_commit=None):
+        """
+        Ставит fn(db, *args) в ближайшую пачку и возвращает её результат после commit.
+        fn не должна сама делать commit. on_commit(result) вызывается в потоке БД
+        после успешного commit (например, для обновления счётчиков).
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((fn, args, on_commit, future))
+        if len(self._pending) >= self.max_batch:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        """
+        Немедленно отправляет накопленные записи в поток БД. Поток один,
+        поэтому запросы, поставленные после flush, увидят эти записи.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        done = asyncio.get_running_loop().run_in_executor(self.executor, self._apply, batch)
+        done.add_done_callback(functools.partial(self._resolve, batch))
+
+    def _apply(self, batch) -> list:
+        outcomes = []
+        with self.session_factory(expire_on_commit=False) as db:
+            for fn, args, _, _ in batch:
+                try:
+                    with db.begin_nested():
+                        outcomes.append((True, fn(db, *args)))
+                except Exception as e:
+                    outcomes.append((False, e))
+            db.commit()
+            for (_, _, on_commit, _), (ok, value) in zip(batch, outcomes):
+                if ok and on_commit:
+                    try:
+                        on_commit(value)
+                    except Exception:
+                        traceback.print_exc()
+        return outcomes
+
+    @staticmethod
+    def _resolve(batch, done):
+        error = done.exception()
+        for i, (_, _, _, future) in enumerate(batch):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+                continue
+            ok, value = done.result()[i]
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
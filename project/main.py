@@ -1,23 +1,42 @@
 # main.py
 
+# Профиль запуска (!startup): ставится до остальных импортов, чтобы учесть их время
+from utils.startup import startup
+startup.imports.start()
+
 import os
 import asyncio
-import json
 import traceback
 
 import nextcord
-from nextcord import ui, ButtonStyle, Interaction, TextChannel, Embed, PermissionOverwrite, SlashOption
+from nextcord import ui, ButtonStyle, Interaction, TextChannel, Embed, SlashOption
 from nextcord.ext import commands
 from dotenv import load_dotenv
-from datetime import datetime
-import aiohttp
-
-from database.models import Base, Ticket, Feedback
-from database.session import engine, SessionLocal
-from database.crud import create_ticket, close_ticket, get_statistics, create_feedback
+from datetime import datetime, timedelta
+
+from database.session import engine
+from database.migrations import run_migrations
+from database.async_crud import (
+    create_ticket, close_ticket, get_statistics, create_feedback, find_duplicate_ticket,
+    get_ticket_by_channel, set_ticket_channel
+)
 from utils.antispam import AntiSpamSystem
-from utils.pdf_generator import generate_pdf
+from utils.ratelimit import parse_limits, make_backend
+from utils.shared_state import make_store, SharedSet
+from utils.cluster import parse_shard_ids
+from utils.registry import ConfigRegistry
+from utils.permissions import PermissionService
+from utils.channel_pool import ChannelPool
+from utils.render_service import TranscriptRenderer, RenderError
+from utils.exporters import find_archive
+from utils.downloader import AttachmentDownloader, MB
+from utils.blobstore import BlobStore
+from utils.recorder import TranscriptRecorder
+from utils.members import MemberCache
+from utils.transcript import AttachmentRef
+from utils.jobs import JobQueue, RetryLater
 from utils.helpers import validate_rating, log_activity
+from utils.metrics import metrics, LoopLagMonitor, serve_metrics
 
 load_dotenv()
 
@@ -25,14 +44,72 @@ intents = nextcord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-bot = commands.Bot(command_prefix="!", intents=intents, help_command=None)
-anti_spam = AntiSpamSystem()
-
-# ─── Setup Database ────────────────────────────────────────────────────────
-Base.metadata.create_all(bind=engine)
+# ─── Member cache ─────────────────────────────────────────────────────────
+# LEAN_MEMBER_CACHE=1: участники не загружаются при старте и не кешируются
+# nextcord; нужные (авторы взаимодействий, создатели тикетов) держатся в LRU
+LEAN_MEMBER_CACHE = os.getenv("LEAN_MEMBER_CACHE", "0") == "1"
+members = MemberCache(maxsize=int(os.getenv("MEMBER_CACHE_SIZE", 5000)))
+member_cache_options = dict(
+    chunk_guilds_at_startup=False,
+    member_cache_flags=nextcord.MemberCacheFlags.none(),
+) if LEAN_MEMBER_CACHE else {}
+
+# ─── Attachments ──────────────────────────────────────────────────────────
+attachment_store = BlobStore(
+    root=os.path.join(os.getcwd(), "attachments", "blobs"),
+    max_bytes=int(os.getenv("ATTACHMENT_STORE_MAX_MB", 0)) * MB,
+    retention_days=int(os.getenv("ATTACHMENT_RETENTION_DAYS", 90)),
+)
+ATTACHMENT_GC_INTERVAL = int(os.getenv("ATTACHMENT_GC_HOURS", 6)) * 3600
+
+downloader = AttachmentDownloader(
+    store=attachment_store,
+    concurrency=int(os.getenv("ATTACHMENT_CONCURRENCY", 8)),
+    max_file_size=int(os.getenv("ATTACHMENT_MAX_FILE_MB", 25)) * MB,
+    max_ticket_size=int(os.getenv("ATTACHMENT_MAX_TICKET_MB", 200)) * MB,
+)
+
+
+# ─── Transcript rendering ─────────────────────────────────────────────────
+renderer = TranscriptRenderer(
+    workers=int(os.getenv("RENDER_WORKERS", 0)) or None,
+    max_pending=int(os.getenv("RENDER_MAX_PENDING", 16)),
+    job_timeout=float(os.getenv("RENDER_TIMEOUT", 120)),
+)
+
+
+# ─── Sharding ─────────────────────────────────────────────────────────────
+# SHARD_COUNT>0 — AutoShardedBot; SHARD_IDS ("0-3") — шарды этого процесса,
+# если бот запущен несколькими процессами (см. run_cluster.py)
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 0))
+SHARD_IDS = parse_shard_ids(os.getenv("SHARD_IDS", ""))
+shard_options = dict(shard_count=SHARD_COUNT, shard_ids=SHARD_IDS or None) if SHARD_COUNT else {}
+
+
+class TicketBot(commands.AutoShardedBot if SHARD_COUNT else commands.Bot):
+    async def close(self):
+        await close_jobs.stop()
+        await loop_lag.stop()
+        if metrics_server:
+            await metrics_server.cleanup()
+        await channel_pool.stop()
+        await attachment_store.stop()
+        await downloader.close()
+        await renderer.close()
+        await super().close()
+
+
+bot = TicketBot(command_prefix="!", intents=intents, help_command=None,
+                **member_cache_options, **shard_options)
+recorder = TranscriptRecorder()
+
+# ─── Shared state ─────────────────────────────────────────────────────────
+# "memory" — один процесс; "sqlite:shared_state.db" — общее для всех процессов бота
+SHARED_STATE = os.getenv("SHARED_STATE", "memory")
+shared_store = make_store(SHARED_STATE)
 
 # ─── Scanned channels for !send ────────────────────────────────────────────
-SCANNED_CHANNELS = set()
+scanned_channels = SharedSet("scanned_channels", shared_store)
 
 # ─── Server 1 config (Anicats) ────────────────────────────────────────────
 GUILD_ID_1           = int(os.getenv("GUILD_ID_1", 0))
@@ -52,14 +129,73 @@ VERIFIED_ROLE_ID   = int(os.getenv("VERIFIED_ROLE_ID", 0))
 REQUIRED_ROLE_ID   = int(os.getenv("REQUIRED_ROLE_ID", 0))
 UNVERIFIED_ROLE_ID = int(os.getenv("UNVERIFIED_ROLE_ID", 0))
 
+# ─── Duplicate detection ──────────────────────────────────────────────────
+DUPLICATE_WINDOW = timedelta(hours=int(os.getenv("DUPLICATE_WINDOW_HOURS", 24)))
+
+# ─── Guild config registry ────────────────────────────────────────────────
+# Серверы из переменных окружения дополняются/перекрываются templates/guilds.json
+registry = ConfigRegistry(
+    guilds_path=os.getenv("GUILDS_CONFIG", "templates/guilds.json"),
+    template_path="templates/response_template.json",
+    env_guilds={
+        GUILD_ID_1: {
+            "admin_role_id": ADMIN_ROLE_ID_1, "support_role_id": SUPPORT_ROLE_ID_1,
+            "category_id": TICKET_CATEGORY_ID_1, "admin_channel_id": ADMIN_CHANNEL_ID_1,
+            "rate_limits": os.getenv("RATE_LIMITS_1", ""),
+        },
+        GUILD_ID_2: {
+            "admin_role_id": ADMIN_ROLE_ID_2,
+            "category_id": TICKET_CATEGORY_ID_2, "admin_channel_id": ADMIN_CHANNEL_ID_2,
+            "rate_limits": os.getenv("RATE_LIMITS_2", ""),
+        },
+    },
+)
+
+# ─── Rate limiting ────────────────────────────────────────────────────────
+# Формат: "ticket_select=1/300,ticket_slash=1/300,feedback=3/60"
+anti_spam = AntiSpamSystem(
+    limits=parse_limits(os.getenv("RATE_LIMITS", "")),
+    guild_limits=registry.rate_limits,
+    backend=make_backend(os.getenv("RATE_LIMIT_BACKEND") or SHARED_STATE),
+)
+
+
+permissions = PermissionService(registry)
+
+# Запас скрытых каналов на категорию тикетов (0 — выключено)
+channel_pool = ChannelPool(
+    size=int(os.getenv("CHANNEL_POOL_SIZE", 0)),
+    spacing=float(os.getenv("CHANNEL_POOL_SPACING", 2)),
+)
+
 
 def get_config_for_guild(guild_id: int):
-    if guild_id == GUILD_ID_1:
-        return ADMIN_ROLE_ID_1, SUPPORT_ROLE_ID_1, TICKET_CATEGORY_ID_1, ADMIN_CHANNEL_ID_1
-    elif guild_id == GUILD_ID_2:
-        return ADMIN_ROLE_ID_2, None, TICKET_CATEGORY_ID_2, ADMIN_CHANNEL_ID_2
-    else:
+    cfg = registry.guild(guild_id)
+    if cfg is None:
         return None, None, None, None
+    return cfg.admin_role_id, cfg.support_role_id, cfg.category_id, cfg.admin_channel_id
+
+async def get_channel(channel_id: int):
+    """
+    Канал из кеша или через API: при нескольких процессах бота канал
+    может относиться к шарду другого процесса
+    """
+    if not channel_id:
+        return None
+    try:
+        return bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+    except nextcord.NotFound:
+        return None
+
+def ticket_categories() -> list:
+    """Категории тикетов всех серверов, где есть бот"""
+    categories = []
+    for guild in bot.guilds:
+        _, _, category_id, _ = get_config_for_guild(guild.id)
+        category = category_id and guild.get_channel(category_id)
+        if isinstance(category, nextcord.CategoryChannel):
+            categories.append(category)
+    return categories
 
 
 @bot.event
@@ -100,26 +236,23 @@ async def верификация_error(ctx: commands.Context, error):
 
 # ─── Ticket creation UI ───────────────────────────────────────────────────
 class TicketView(ui.View):
-    def __init__(self):
+    def __init__(self, guild_id: int = None):
         super().__init__(timeout=None)
-        self.add_item(TagSelect())
+        self.add_item(TagSelect(guild_id))
 
 class TagSelect(ui.Select):
-    def __init__(self):
+    def __init__(self, guild_id: int = None):
         options = [
-            nextcord.SelectOption(label="Срочно", emoji="🔥", value="urgent"),
-            nextcord.SelectOption(label="Вопрос", emoji="❓", value="question"),
-            nextcord.SelectOption(label="Баг", emoji="🐛", value="bug"),
+            nextcord.SelectOption(label=tag.label, emoji=tag.emoji or None, value=tag.value)
+            for tag in registry.tags(guild_id)
         ]
-        super().__init__(placeholder="Выберите тип тикета…", options=options)
+        super().__init__(placeholder="Выберите тип тикета…", options=options,
+                         custom_id="ticket_tag_select")
 
     async def callback(self, interaction: Interaction):
-        admin_id, support_id, category_id, _ = get_config_for_guild(interaction.guild.id)
-        is_admin   = admin_id   and any(r.id == admin_id   for r in interaction.user.roles)
-        is_support = support_id and any(r.id == support_id for r in interaction.user.roles)
-
-        if not (is_admin or is_support) and anti_spam.check_spam(interaction.user.id):
-            anti_spam.log_activity(interaction.user.id)
+        if not permissions.is_staff(interaction.user) and await anti_spam.check_spam(
+                interaction.user.id, interaction.guild.id, "ticket_select"):
+            anti_spam.log_activity(interaction.user.id, "ticket_select")
             return await interaction.response.send_message(
                 "❌ Слишком много запросов! Попробуйте позже.", ephemeral=True
             )
@@ -137,46 +270,36 @@ class TicketModal(ui.Modal):
         self.add_item(self.issue)
 
     async def callback(self, interaction: Interaction):
-        admin_id, support_id, category_id, _ = get_config_for_guild(interaction.guild.id)
+        # Ответ откладываем сразу: создание канала может не уложиться в 3 секунды
+        await interaction.response.defer(ephemeral=True)
+        _, _, category_id, _ = get_config_for_guild(interaction.guild.id)
         try:
-            with SessionLocal() as db:
-                if db.query(Ticket).filter(Ticket.content == self.issue.value).first():
-                    return await interaction.response.send_message(
-                        "❌ Такой тикет уже существует!", ephemeral=True
-                    )
-                ticket = create_ticket(db, interaction.user.id, self.issue.value, self.tag)
-            log_activity(f"ticket created user={interaction.user.id} id={ticket.id}")
-            await self._create_channel(interaction, ticket, admin_id, support_id, category_id)
+            if await find_duplicate_ticket(interaction.user.id, interaction.guild.id,
+                                           self.issue.value, DUPLICATE_WINDOW):
+                return await interaction.followup.send("❌ Такой тикет уже существует!", ephemeral=True)
+            with metrics.timer("ticket_step_seconds", step="create_ticket"):
+                ticket = await create_ticket(interaction.user.id, self.issue.value, self.tag,
+                                             interaction.guild.id)
+            log_activity("ticket_created", user=interaction.user.id, ticket=ticket.id)
+            await self._create_channel(interaction, ticket, category_id)
         except Exception:
             traceback.print_exc()
-            await interaction.response.send_message("❌ Ошибка при создании тикета.", ephemeral=True)
+            await interaction.followup.send("❌ Ошибка при создании тикета.", ephemeral=True)
 
-    async def _create_channel(self, interaction, ticket, admin_id, support_id, category_id):
+    async def _create_channel(self, interaction, ticket, category_id):
         if not category_id:
-            return await interaction.response.send_message("❌ Категория не настроена.", ephemeral=True)
+            return await interaction.followup.send("❌ Категория не настроена.", ephemeral=True)
         category = interaction.guild.get_channel(category_id)
         if not category:
-            return await interaction.response.send_message("❌ Категория не найдена.", ephemeral=True)
-
-        overwrites = {
-            interaction.guild.default_role: PermissionOverwrite(view_channel=False),
-            interaction.user:                PermissionOverwrite(view_channel=True, send_messages=True),
-            bot.user:                        PermissionOverwrite(view_channel=True, manage_channels=True)
-        }
-        if admin_id:
-            overwrites[interaction.guild.get_role(admin_id)] = PermissionOverwrite(
-                view_channel=True, send_messages=True, manage_messages=True
-            )
-        if support_id:
-            overwrites[interaction.guild.get_role(support_id)] = PermissionOverwrite(
-                view_channel=True, send_messages=True
-            )
+            return await interaction.followup.send("❌ Категория не найдена.", ephemeral=True)
 
-        channel = await category.create_text_channel(f"ticket-{ticket.id}", overwrites=overwrites)
-        tpl = json.load(open("templates/response_template.json", encoding="utf-8"))
+        overwrites = permissions.ticket_overwrites(interaction.guild, interaction.user)
+        with metrics.timer("ticket_step_seconds", step="create_channel"):
+            channel = await channel_pool.claim(category, f"ticket-{ticket.id}", overwrites)
+        await set_ticket_channel(ticket.id, channel.id)
 
         embed = Embed(
-            title=f"Тикет #{ticket.id} {tpl['tags'][self.tag]}",
+            title=f"Тикет #{ticket.id} {registry.tag_title(interaction.guild.id, self.tag)}",
             description=f"**{interaction.user.mention}**\n{self.issue.value}",
             color=nextcord.Color.green()
         )
@@ -184,32 +307,33 @@ class TicketModal(ui.Modal):
         view.add_item(ui.Button(style=ButtonStyle.red, label="Закрыть тикет", custom_id="close_ticket"))
 
         await channel.send(embed=embed, view=view)
-        await interaction.response.send_message(f"✅ Тикет создан: {channel.mention}", ephemeral=True)
+        await interaction.followup.send(f"✅ Тикет создан: {channel.mention}", ephemeral=True)
 
 
 # ─── Feedback UI ─────────────────────────────────────────────────────────
 class FeedbackView(ui.View):
+    # Тикет, автор и сервер зашиты в custom_id кнопок: нажатие в ЛС приходит
+    # процессу с шардом 0, а не тому, что отправил сообщение, поэтому оно
+    # разбирается в on_interaction (handle_rating) — и после перезапуска тоже
     def __init__(self, ticket_id, creator_id, guild_id):
         super().__init__(timeout=None)
-        self.ticket_id  = ticket_id
-        self.creator_id = int(creator_id)   # ← приводим к int
-        self.guild_id   = guild_id
         for i in range(1, 6):
-            btn = ui.Button(label=str(i), style=ButtonStyle.blurple, custom_id=f"rate_{i}")
-            btn.callback = self._make_callback(i)
-            self.add_item(btn)
-
-    def _make_callback(self, rating):
-        async def cb(interaction: Interaction):
-            if interaction.user.id != self.creator_id:
-                print(f"[DEBUG] Отзыв отклонён: user={interaction.user.id}, creator={self.creator_id}")
-                return await interaction.response.send_message(
-                    "❌ Только создатель может оставить отзыв.", ephemeral=True
-                )
-            await interaction.response.send_modal(
-                FeedbackModal(self.ticket_id, self.creator_id, rating, self.guild_id)
-            )
-        return cb
+            self.add_item(ui.Button(label=str(i), style=ButtonStyle.blurple,
+                                    custom_id=f"rate_{i}:{ticket_id}:{creator_id}:{guild_id}"))
+
+async def handle_rating(interaction: Interaction, custom_id: str):
+    rating, ticket_id, creator_id, guild_id = map(int, custom_id[len("rate_"):].split(":"))
+    if interaction.user.id != creator_id:
+        print(f"[DEBUG] Отзыв отклонён: user={interaction.user.id}, creator={creator_id}")
+        return await interaction.response.send_message(
+            "❌ Только создатель может оставить отзыв.", ephemeral=True
+        )
+    if await anti_spam.check_spam(interaction.user.id, guild_id, "feedback"):
+        anti_spam.log_activity(interaction.user.id, "feedback")
+        return await interaction.response.send_message(
+            "❌ Слишком много запросов! Попробуйте позже.", ephemeral=True
+        )
+    await interaction.response.send_modal(FeedbackModal(ticket_id, creator_id, rating, guild_id))
 
 class FeedbackModal(ui.Modal):
     def __init__(self, ticket_id, creator_id, rating, guild_id):
@@ -227,11 +351,11 @@ class FeedbackModal(ui.Modal):
 
     async def callback(self, interaction: Interaction):
         try:
-            with SessionLocal() as db:
-                fb = create_feedback(db, interaction.user.id, self.rating, comment=self.comment.value or None, ticket_id=self.ticket_id)
+            fb = await create_feedback(interaction.user.id, self.rating, comment=self.comment.value or None,
+                                       ticket_id=self.ticket_id, guild_id=self.guild_id)
             if not fb:
                 return await interaction.response.send_message("❌ Отзыв уже оставлен.", ephemeral=True)
-            log_activity(f"feedback user={interaction.user.id} rating={self.rating} ticket={self.ticket_id}")
+            log_activity("feedback", user=interaction.user.id, rating=self.rating, ticket=self.ticket_id)
 
             creator = await bot.fetch_user(self.creator_id)
             await creator.send(embed=Embed(
@@ -241,7 +365,7 @@ class FeedbackModal(ui.Modal):
             ))
 
             _, _, _, admin_ch = get_config_for_guild(self.guild_id)
-            ch = bot.get_channel(admin_ch)
+            ch = await get_channel(admin_ch)
             if ch:
                 await ch.send(embed=Embed(
                     title=f"Новый отзыв: {self.rating}/5",
@@ -255,36 +379,115 @@ class FeedbackModal(ui.Modal):
             await interaction.response.send_message("❌ Ошибка при сохранении отзыва.", ephemeral=True)
 
 
+# ─── Metrics ──────────────────────────────────────────────────────────────
+# METRICS_PORT>0 — отдавать метрики в формате Prometheus на 127.0.0.1:<порт>/metrics
+# (run_cluster.py даёт процессам порты METRICS_PORT, METRICS_PORT+1, ...)
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+metrics_server = None
+loop_lag = LoopLagMonitor()
+
+def _gateway_latency():
+    if SHARD_COUNT:
+        return [({"shard": shard_id}, latency) for shard_id, latency in bot.latencies]
+    return bot.latency
+
+metrics.gauge("gateway_latency_seconds", _gateway_latency)
+metrics.gauge("member_cache_size", lambda: len(members))
+metrics.gauge("startup_phase_seconds",
+              lambda: [({"phase": name}, took) for name, (_, took) in startup.phases.items()])
+
+async def start_metrics():
+    global metrics_server
+    loop_lag.start()
+    if METRICS_PORT and metrics_server is None:
+        try:
+            metrics_server = await serve_metrics(metrics, "127.0.0.1", METRICS_PORT)
+        except OSError as e:
+            # Метрики необязательны: занятый порт не должен мешать работе бота
+            print(f"[WARN] metrics endpoint on port {METRICS_PORT} not started: {e}")
+
+
 # ─── Core commands/events ─────────────────────────────────────────────────
 @bot.event
 async def on_ready():
     print(f"Бот запущен: {bot.user}")
+    if "ready" not in startup.phases:
+        startup.mark("ready", since="migrations")
+        log_activity("startup", **{name: round(at, 3) for name, (at, _) in startup.phases.items()})
     bot.add_view(TicketView())
+    # Процессы рендера поднимаются и грузят PDF-стек в фоне — on_ready их не ждёт
+    startup.track("render_warm_up", renderer.warm_up())
+    await close_jobs.start()
+    attachment_store.start(ATTACHMENT_GC_INTERVAL)
+    channel_pool.start(ticket_categories())
+    # Backfill открытых тикетов идёт в фоне: на запрос истории каждого канала
+    # уходит время, а закрытие тикета догрузит свой канал само
+    startup.track("transcript_backfill", recorder.sync_guilds(bot.guilds))
+    await start_metrics()
+
+# ─── Transcript recording ─────────────────────────────────────────────────
+@bot.listen("on_message")
+async def record_message(message: nextcord.Message):
+    if LEAN_MEMBER_CACHE:
+        members.remember(message.author)
+    await recorder.on_message(message)
+
+@bot.listen("on_raw_message_edit")
+async def record_message_edit(payload: nextcord.RawMessageUpdateEvent):
+    await recorder.on_raw_message_edit(payload, bot.get_channel(payload.channel_id))
+
+@bot.listen("on_raw_message_delete")
+async def record_message_delete(payload: nextcord.RawMessageDeleteEvent):
+    await recorder.on_raw_message_delete(payload, bot.get_channel(payload.channel_id))
+
+@bot.listen("on_raw_bulk_message_delete")
+async def record_bulk_message_delete(payload: nextcord.RawBulkMessageDeleteEvent):
+    await recorder.on_raw_bulk_message_delete(payload, bot.get_channel(payload.channel_id))
+
+@bot.listen("on_guild_channel_delete")
+async def purge_transcript(channel):
+    channel_pool.discard(channel.id)
+    await recorder.on_channel_delete(channel)
+
+# ─── Member cache ─────────────────────────────────────────────────────────
+@bot.listen("on_interaction")
+async def remember_member(interaction: Interaction):
+    if LEAN_MEMBER_CACHE:
+        members.remember(interaction.user)
+
+# Без кеша nextcord on_member_remove не приходит — только raw-событие
+@bot.listen("on_raw_member_remove")
+async def forget_member(payload):
+    members.forget(payload.guild_id, payload.user.id)
+
+# ─── Permission cache ─────────────────────────────────────────────────────
+@bot.listen("on_guild_role_update")
+async def refresh_staff_roles(before, after):
+    permissions.on_role_change(after)
+
+@bot.listen("on_guild_role_delete")
+async def drop_staff_role(role):
+    permissions.on_role_change(role)
 
 @bot.command()
 @commands.has_permissions(administrator=True)
 async def scan(ctx):
-    SCANNED_CHANNELS.clear()
-    for ch in ctx.guild.text_channels:
-        SCANNED_CHANNELS.add(ch.id)
-    await ctx.send(f"✅ Отсканировано {len(SCANNED_CHANNELS)} каналов.", delete_after=5)
+    await scanned_channels.replace(ch.id for ch in ctx.guild.text_channels)
+    await ctx.send(f"✅ Отсканировано {await scanned_channels.count()} каналов.", delete_after=5)
 
 @bot.command()
 @commands.has_permissions(administrator=True)
 async def send(ctx, channel: TextChannel):
-    admin_id, support_id, _, _ = get_config_for_guild(ctx.guild.id)
-    is_admin   = admin_id and any(r.id == admin_id for r in ctx.author.roles)
-    is_support = support_id and any(r.id == support_id for r in ctx.author.roles)
-    if not (is_admin or is_support):
+    if not permissions.is_staff(ctx.author):
         return await ctx.send("❌ Нет прав для !send.", delete_after=5)
-    if channel.id not in SCANNED_CHANNELS:
+    if not await scanned_channels.contains(channel.id):
         return await ctx.send("❌ Канал не отсканирован. Сначала !scan.", delete_after=5)
     embed = Embed(
         title="🎫 Техническая поддержка",
         description="Нажмите кнопку, чтобы создать тикет",
         color=nextcord.Color.blue()
     )
-    await channel.send(embed=embed, view=TicketView())
+    await channel.send(embed=embed, view=TicketView(ctx.guild.id))
     await ctx.send(f"✅ Панель отправлена в {channel.mention}", delete_after=5)
 
 @bot.command()
@@ -295,31 +498,92 @@ async def setup(ctx):
         description="Нажмите кнопку, чтобы создать тикет",
         color=nextcord.Color.blue()
     )
-    await ctx.send(embed=embed, view=TicketView())
+    await ctx.send(embed=embed, view=TicketView(ctx.guild.id))
     await ctx.send("✅ Система настроена!", delete_after=5)
 
 @bot.command()
 @commands.has_permissions(administrator=True)
-async def stats(ctx):
-    with SessionLocal() as db:
-        stats = get_statistics(db)
+async def reload(ctx):
+    await asyncio.to_thread(registry.reload, True)
+    channel_pool.start(ticket_categories())
+    await ctx.send(f"✅ Настройки перечитаны ({len(registry.guild_ids())} серверов).", delete_after=5)
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def stats(ctx, scope: str = None):
+    """!stats — по текущему серверу, !stats all — по всем серверам"""
+    stats = await get_statistics(None if scope == "all" else ctx.guild.id)
     embed = Embed(title="📊 Статистика тикетов", color=0x00ff00)
     embed.add_field(name="Всего", value=stats["total_tickets"])
     embed.add_field(name="Открытые", value=stats["open_tickets"])
     embed.add_field(name="Средняя оценка", value=f"{stats['avg_rating']:.2f}/5")
+    median = stats["median_close_seconds"]
+    embed.add_field(name="Медиана до закрытия",
+                    value=str(timedelta(seconds=int(median))) if median is not None else "—")
+    embed.add_field(name="За 7 дней", value=sum(stats["by_day"].values()))
+    if stats["by_tag"]:
+        embed.add_field(
+            name="По тегам",
+            value="\n".join(f"{tag}: {c['total']} (открыто {c['open']})"
+                            for tag, c in sorted(stats["by_tag"].items())),
+            inline=False
+        )
+    if stats["unassigned_tickets"]:
+        embed.set_footer(text=f"Ещё {stats['unassigned_tickets']} старых тикетов без сервера — см. !stats all "
+                              f"(или STATS_LEGACY_GUILD_ID)")
+    await ctx.send(embed=embed)
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def perf(ctx):
+    """!perf — задержки этапов (p50/p99), задержка event loop и шлюза"""
+    summary = metrics.summary()
+    lines = []
+    for (name, labels), h in sorted(summary["histograms"].items(), key=lambda kv: -kv[1]["avg"] * kv[1]["count"]):
+        label = ",".join(str(v) for _, v in labels)
+        lines.append(f"`{name}{'[' + label + ']' if label else ''}` n={h['count']} "
+                     f"p50={h['p50'] * 1000:.0f}мс p99={h['p99'] * 1000:.0f}мс max={h['max'] * 1000:.0f}мс")
+    embed = Embed(title="⏱ Производительность", description="\n".join(lines)[:4000] or "Нет данных",
+                  color=nextcord.Color.blurple())
+    embed.add_field(name="Event loop", value=f"{loop_lag.last * 1000:.1f} мс")
+    embed.add_field(name="Шлюз", value=f"{bot.latency * 1000:.0f} мс")
+    counters = "\n".join(f"{name}{dict(labels) if labels else ''}: {value:g}"
+                         for (name, labels), value in sorted(summary["counters"].items()))
+    if counters:
+        embed.add_field(name="Счётчики", value=counters[:1024], inline=False)
     await ctx.send(embed=embed)
 
+@bot.command(name="startup")
+@commands.has_permissions(administrator=True)
+async def startup_report(ctx, top: int = 15):
+    """!startup [N] — этапы запуска и N самых долгих импортов (как python -X importtime)"""
+    await ctx.send(f"```\n{startup.report(top)[:1900]}\n```")
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def transcript(ctx, ticket_id: int, fmt: str = "pdf"):
+    """!transcript <id> [pdf|html|jsonl] — транскрипт закрытого тикета (строится по запросу)"""
+    archive = find_archive(ticket_id)
+    if not archive:
+        return await ctx.send("❌ Архив тикета не найден.", delete_after=5)
+    try:
+        path = archive if fmt == "jsonl" else await renderer.render_archive(ticket_id, archive, fmt)
+    except (RenderError, ValueError) as e:
+        return await ctx.send(f"❌ Не удалось собрать транскрипт: {e}", delete_after=10)
+    await ctx.send(file=nextcord.File(path))
+
 @bot.event
 async def on_interaction(interaction: Interaction):
     if interaction.type != nextcord.InteractionType.component:
-        return
-    if interaction.data.get("custom_id") == "close_ticket":
-        admin_id, support_id, _, _ = get_config_for_guild(interaction.guild.id)
-        is_admin   = admin_id and any(r.id == admin_id for r in interaction.user.roles)
-        is_support = support_id and any(r.id == support_id for r in interaction.user.roles)
-        if not (is_admin or is_support):
+        # Обработчик заменяет Client.on_interaction — слэш-команды вызываем сами
+        return await bot.process_application_commands(interaction)
+    custom_id = interaction.data.get("custom_id", "")
+    if custom_id == "close_ticket":
+        if not permissions.is_staff(interaction.user):
             return await interaction.response.send_message("❌ Нет прав закрывать тикеты.", ephemeral=True)
         await handle_ticket_close(interaction)
+    elif custom_id.startswith("rate_") and custom_id.count(":") == 3:
+        await handle_rating(interaction, custom_id)
 
 async def handle_ticket_close(interaction: Interaction):
     try:
@@ -328,85 +592,126 @@ async def handle_ticket_close(interaction: Interaction):
         pass
 
     channel = interaction.channel
-    ticket_id = int(channel.name.split("-", 1)[1])
-
-    with SessionLocal() as db:
-        ticket = close_ticket(db, ticket_id)
-        creator_id = ticket.user_id
-        issue_txt  = ticket.content
-
-    history = await channel.history(limit=100).flatten()
-    logs, atts = [], []
-    for msg in reversed(history):
-        logs.append({"author": str(msg.author), "content": msg.content or ""})
-        atts.extend(msg.attachments)
-
-    local_atts = []
-    async with aiohttp.ClientSession() as sess:
-        for att in atts:
-            save_dir = os.path.join(os.getcwd(), "attachments")
-            os.makedirs(save_dir, exist_ok=True)
-            fname = f"{att.id}_{att.filename}"
-            path  = os.path.join(save_dir, fname)
-            try:
-                async with sess.get(att.url) as resp:
-                    if resp.status == 200:
-                        with open(path, "wb") as f:
-                            f.write(await resp.read())
-                        local_atts.append((path, att.url))
-            except:
-                pass
-
-    creator = interaction.guild.get_member(creator_id) or await bot.fetch_user(creator_id)
-    creator_name = getattr(creator, "display_name", getattr(creator, "name", str(creator_id)))
-
-    pdf_path = generate_pdf(str(ticket_id), creator_name, issue_txt, logs, local_atts)
-    log_activity(f"PDF generated: ticket={ticket_id} file={pdf_path}")
-
+    ticket = await get_ticket_by_channel(channel.id)
+    # Тикеты, созданные до появления channel_id, ищем по имени канала
+    ticket_id = ticket.id if ticket else int(channel.name.split("-", 1)[1])
+
+    ticket, was_open = await close_ticket(ticket_id)
+    if ticket is None:
+        return await interaction.followup.send("❌ Тикет не найден.", ephemeral=True)
+    if not was_open:
+        # Повторное нажатие или другой сотрудник: задача закрытия уже поставлена
+        return await interaction.followup.send("⚠️ Тикет уже закрыт.", ephemeral=True)
+    delete_at = datetime.now() + timedelta(seconds=CLOSE_DELETE_DELAY)
+    await close_jobs.enqueue({
+        "ticket_id": ticket_id,
+        "guild_id": interaction.guild.id,
+        "channel_id": channel.id,
+        "creator_id": int(ticket.user_id),  # в БД — строка, кеши nextcord ищут по int
+        "issue": ticket.content,
+        "delete_at": delete_at.isoformat(),
+    })
+    await interaction.followup.send(f"✅ Тикет закрыт. Канал удалится через {CLOSE_DELETE_DELAY} секунд.", ephemeral=True)
+
+
+# ─── Ticket close pipeline ────────────────────────────────────────────────
+# Каждый этап сохраняет результат в payload задачи; после перезапуска
+# задача продолжается с незавершённого этапа, поэтому этапы идемпотентны.
+
+CLOSE_DELETE_DELAY = int(os.getenv("CLOSE_DELETE_DELAY", 10))
+
+async def _resolve_creator(guild_id: int, creator_id: int):
+    creator_id = int(creator_id)  # задачи, поставленные до перехода на int в payload
+    guild = bot.get_guild(guild_id)
+    return (guild and await members.get(guild, creator_id)) or await bot.fetch_user(creator_id)
+
+async def close_stage_capture(job: dict):
+    channel = bot.get_channel(job["channel_id"])
+    spool_path, atts = await recorder.capture(job["channel_id"], job["ticket_id"], channel)
+    job["spool"] = spool_path
+    job["attachments"] = [att._asdict() for att in atts]
+
+async def close_stage_download(job: dict):
+    atts = [AttachmentRef(**att) for att in job["attachments"]]
+    job["local_attachments"] = await downloader.download_all(atts, ticket_id=job["ticket_id"])
+
+async def close_stage_render(job: dict):
+    ticket_id = job["ticket_id"]
+    if not os.path.exists(job["spool"]):
+        # Spool мог пропасть при перезапуске — сообщения остаются в БД до удаления канала
+        job["spool"], _ = await recorder.capture(job["channel_id"], ticket_id)
+    creator = await _resolve_creator(job["guild_id"], job["creator_id"])
+    creator_name = getattr(creator, "display_name", getattr(creator, "name", str(job["creator_id"])))
+
+    # Архив пишется всегда (из него PDF строится по запросу), плюс формат сервера.
+    # Ошибка рендера (в т.ч. переполненная очередь) уходит в JobQueue — этап
+    # повторится с задержкой, а канал с сообщениями не удалится без транскрипта
+    formats = {"jsonl", registry.transcript_format(job["guild_id"])}
+    paths = await renderer.render(str(ticket_id), creator_name, job["issue"], job["spool"],
+                                  [tuple(a) for a in job["local_attachments"]], formats=sorted(formats))
+    log_activity("transcript_generated", ticket=ticket_id, files=paths)
+    os.remove(job["spool"])
+
+async def close_stage_notify(job: dict):
+    ticket_id, creator_id, guild_id = job["ticket_id"], job["creator_id"], job["guild_id"]
     try:
-        await creator.send(
-            embed=Embed(
-                title="Ваш тикет закрыт",
-                description="Пожалуйста, оцените работу от 1 до 5",
-                color=nextcord.Color.gold()
-            ),
-            view=FeedbackView(ticket_id, creator_id, interaction.guild.id)
-        )
-    except:
-        _, _, _, admin_ch = get_config_for_guild(interaction.guild.id)
-        await bot.get_channel(admin_ch).send(f"Не удалось DM {creator_id} по закрытию #{ticket_id}")
-
-    await interaction.followup.send("✅ Канал удалится через 10 секунд.", ephemeral=True)
-    await asyncio.sleep(10)
+        creator = await _resolve_creator(guild_id, creator_id)
+        with metrics.timer("ticket_step_seconds", step="send_dm"):
+            await creator.send(
+                embed=Embed(
+                    title="Ваш тикет закрыт",
+                    description="Пожалуйста, оцените работу от 1 до 5",
+                    color=nextcord.Color.gold()
+                ),
+                view=FeedbackView(ticket_id, creator_id, guild_id)
+            )
+        metrics.inc("close_notifications_total", result="dm")
+    except nextcord.HTTPException:
+        metrics.inc("close_notifications_total", result="admin_channel")
+        _, _, _, admin_ch = get_config_for_guild(guild_id)
+        await (await get_channel(admin_ch)).send(f"Не удалось DM {creator_id} по закрытию #{ticket_id}")
+
+async def close_stage_delete(job: dict):
+    remaining = (datetime.fromisoformat(job["delete_at"]) - datetime.now()).total_seconds()
+    if remaining > 0:
+        raise RetryLater(remaining)
+    channel = await get_channel(job["channel_id"])
+    if channel is None:
+        return
     try:
         await channel.delete()
-    except:
+    except nextcord.NotFound:
         pass
 
-@bot.slash_command(name="ticket_slash", description="Создать тикет через Slash", guild_ids=[GUILD_ID_1, GUILD_ID_2])
+close_jobs = JobQueue(
+    "ticket_close",
+    [
+        ("capture", close_stage_capture),
+        ("download", close_stage_download),
+        ("render", close_stage_render),
+        ("notify", close_stage_notify),
+        ("delete", close_stage_delete),
+    ],
+    workers=int(os.getenv("CLOSE_WORKERS", 4)),
+    max_attempts=int(os.getenv("CLOSE_MAX_ATTEMPTS", 5)),
+)
+
+@bot.slash_command(name="ticket_slash", description="Создать тикет через Slash", guild_ids=registry.guild_ids() or None)
 async def ticket_slash(interaction: Interaction, тема: str = SlashOption(description="Описание проблемы", required=True)):
-    admin_id, support_id, cat_id, _ = get_config_for_guild(interaction.guild.id)
-    is_admin   = admin_id and any(r.id == admin_id for r in interaction.user.roles)
-    is_support = support_id and any(r.id == support_id for r in interaction.user.roles)
-    if not (is_admin or is_support) and anti_spam.check_spam(interaction.user.id):
-        anti_spam.log_activity(interaction.user.id)
+    _, _, cat_id, _ = get_config_for_guild(interaction.guild.id)
+    if not permissions.is_staff(interaction.user) and await anti_spam.check_spam(
+            interaction.user.id, interaction.guild.id, "ticket_slash"):
+        anti_spam.log_activity(interaction.user.id, "ticket_slash")
         return await interaction.response.send_message("❌ Слишком много запросов!", ephemeral=True)
     if not cat_id:
         return await interaction.response.send_message("⚠️ Конфигурация не найдена.", ephemeral=True)
+    await interaction.response.defer(ephemeral=True)
 
-    overwrites = {
-        interaction.guild.default_role: PermissionOverwrite(view_channel=False),
-        interaction.user:                PermissionOverwrite(view_channel=True, send_messages=True),
-        bot.user:                        PermissionOverwrite(view_channel=True, manage_channels=True)
-    }
-    if admin_id:
-        overwrites[interaction.guild.get_role(admin_id)] = PermissionOverwrite(view_channel=True, send_messages=True, manage_messages=True)
-    if support_id:
-        overwrites[interaction.guild.get_role(support_id)] = PermissionOverwrite(view_channel=True, send_messages=True)
-
-    channel = await interaction.guild.get_channel(cat_id).create_text_channel(name=f"ticket-{interaction.user.name}", overwrites=overwrites)
-    with SessionLocal() as db:
-        ticket = create_ticket(db, interaction.user.id, тема, "slash")
+    overwrites = permissions.ticket_overwrites(interaction.guild, interaction.user)
+    with metrics.timer("ticket_step_seconds", step="create_channel"):
+        channel = await channel_pool.claim(interaction.guild.get_channel(cat_id), f"ticket-{interaction.user.name}", overwrites)
+    with metrics.timer("ticket_step_seconds", step="create_ticket"):
+        ticket = await create_ticket(interaction.user.id, тема, "slash", interaction.guild.id, channel.id)
 
     embed = Embed(
         title=f"Тикет #{ticket.id}",
@@ -417,8 +722,14 @@ async def ticket_slash(interaction: Interaction, тема: str = SlashOption(des
     view.add_item(ui.Button(style=ButtonStyle.red, label="Закрыть тикет", custom_id="close_ticket"))
 
     await channel.send(embed=embed, view=view)
-    await interaction.response.send_message(f"✅ Создан: {channel.mention}", ephemeral=True)
+    await interaction.followup.send(f"✅ Создан: {channel.mention}", ephemeral=True)
+
 
+startup.finish_imports()
 
 if __name__ == "__main__":
+    with startup.phase("migrations"):
+        # run_cluster.py применяет миграции сам, до запуска процессов
+        if int(os.getenv("RUN_MIGRATIONS", 1)):
+            run_migrations(engine)
     bot.run(os.getenv("BOT_TOKEN"))
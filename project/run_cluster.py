@@ -0,0 +1,65 @@
+# run_cluster.py
+"""
+Запуск бота несколькими процессами.
+
+SHARD_COUNT шардов делятся поровну между CLUSTER_PROCESSES процессами
+main.py — каждый получает свой диапазон в SHARD_IDS. Общее состояние
+(лимиты антиспама, отсканированные каналы) процессы держат в SHARED_STATE,
+тикеты и задачи — в общей БД (DATABASE_URL).
+
+    SHARD_COUNT=8 CLUSTER_PROCESSES=4 python run_cluster.py
+"""
+
+import os
+import sys
+import signal
+import subprocess
+
+from dotenv import load_dotenv
+
+from utils.cluster import shard_ranges
+
+
+def main():
+    load_dotenv()
+    cpus = os.cpu_count() or 1
+    shard_count = int(os.getenv("SHARD_COUNT", 0)) or cpus
+    processes = int(os.getenv("CLUSTER_PROCESSES", 0)) or min(cpus, shard_count)
+    ranges = shard_ranges(shard_count, processes)
+
+    # Миграции — один раз до запуска процессов: параллельные ALTER TABLE
+    # на свежей БД падают с "duplicate column" или "database is locked"
+    from database.session import engine
+    from database.migrations import run_migrations
+    run_migrations(engine)
+
+    common = {
+        "SHARD_COUNT": str(shard_count),
+        "RUN_MIGRATIONS": "0",
+        "SHARED_STATE": os.getenv("SHARED_STATE") or "sqlite:shared_state.db",
+        "STATS_MAX_AGE": os.getenv("STATS_MAX_AGE") or "60",
+        # Процессы рендера делят ядра между всеми процессами бота
+        "RENDER_WORKERS": os.getenv("RENDER_WORKERS") or str(max(1, cpus // len(ranges))),
+    }
+    # Каждому процессу — свой порт метрик: METRICS_PORT, METRICS_PORT+1, ...
+    metrics_port = int(os.getenv("METRICS_PORT", 0))
+    children = []
+    for index, ids in enumerate(ranges):
+        env = {**os.environ, **common, "SHARD_IDS": f"{ids[0]}-{ids[-1]}"}
+        if metrics_port:
+            env["METRICS_PORT"] = str(metrics_port + index)
+        print(f"[cluster] shards {ids[0]}-{ids[-1]} of {shard_count}")
+        children.append(subprocess.Popen([sys.executable, "main.py"], env=env))
+
+    try:
+        for child in children:
+            child.wait()
+    except KeyboardInterrupt:
+        for child in children:
+            child.send_signal(signal.SIGINT)
+        for child in children:
+            child.wait()
+
+
+if __name__ == "__main__":
+    main()
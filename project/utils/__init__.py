@@ -1,5 +1,12 @@
 from .antispam import AntiSpamSystem
-from .pdf_generator import generate_pdf
 from .helpers import validate_rating, log_activity
 
-__all__ = ["AntiSpamSystem", "generate_pdf", "validate_rating", "log_activity"]
\ No newline at end of file
+__all__ = ["AntiSpamSystem", "generate_pdf", "validate_rating", "log_activity"]
+
+
+def __getattr__(name):
+    # reportlab и PIL грузятся только при первом обращении к generate_pdf
+    if name == "generate_pdf":
+        from .pdf_generator import generate_pdf
+        return generate_pdf
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -1,23 +1,31 @@
-from datetime import datetime, timedelta
 from utils.helpers import log_activity
+from utils.ratelimit import RateLimiter, RateLimit
+
+# Лимиты по умолчанию: один тикет за 5 минут, не больше 3 отзывов в минуту
+DEFAULT_LIMITS = {
+    "ticket_select": RateLimit(1, 300),
+    "ticket_slash": RateLimit(1, 300),
+    "feedback": RateLimit(3, 60),
+}
+
 
 class AntiSpamSystem:
-    def __init__(self):
-        self.users = {}
+    """
+    Защита от спама поверх RateLimiter (скользящее окно).
+    limits переопределяют DEFAULT_LIMITS, guild_limits — лимиты отдельных серверов,
+    backend — общее хранилище для нескольких процессов (см. utils.ratelimit).
+    """
+
+    def __init__(self, limits: dict = None, guild_limits: dict = None, backend=None):
+        self.limiter = RateLimiter({**DEFAULT_LIMITS, **(limits or {})}, guild_limits, backend)
 
-    def check_spam(self, user_id: str) -> bool:
-        now = datetime.now()
-        if user_id in self.users:
-            last_request = self.users[user_id]
-            if now - last_request < timedelta(minutes=5):
-                return True
-        self.users[user_id] = now
-        return False
+    async def check_spam(self, user_id, guild_id=None, action: str = "ticket_select") -> bool:
+        """True, если пользователь превысил лимит для действия"""
+        return not await self.limiter.hit(user_id, guild_id, action)
 
-    def reset(self, user_id: str):
-        if user_id in self.users:
-            del self.users[user_id]
+    async def reset(self, user_id, guild_id=None, action: str = "ticket_select"):
+        await self.limiter.reset(user_id, guild_id, action)
 
-    def log_activity(self, user_id: str):
+    def log_activity(self, user_id, action: str = None):
         """Делаем запись в общий лог через helpers.log_activity"""
-        log_activity(f"AntiSpam check for user {user_id}")
+        log_activity("antispam_hit", user=user_id, action=action)
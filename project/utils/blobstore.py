@@ -0,0 +1,175 @@
+# utils/blobstore.py
+
+import os
+import re
+import glob
+import time
+import uuid
+import asyncio
+from datetime import datetime, timedelta
+
+from database.async_crud import (
+    find_attachment_blob, put_blob, link_attachment, blob_usage,
+    expire_attachments, orphan_blobs, delete_blobs
+)
+from utils.helpers import log_activity
+
+# Кеш уменьшенных копий из utils.images — чистится вместе с blob-ами
+THUMB_DIR = os.path.join("attachments", ".thumbs")
+_EXT_RE = re.compile(r"^\.[a-z0-9]{1,15}$")
+
+
+def safe_ext(filename: str) -> str:
+    ext = os.path.splitext(filename)[1].lower()
+    return ext if _EXT_RE.match(ext) else ""
+
+
+class BlobStore:
+    """
+    Хранилище вложений с адресацией по содержимому.
+
+    Каждый файл хранится один раз под своим sha256 в каталогах
+    root/ab/cd/<sha256><ext>, так что ни в одном каталоге не скапливаются
+    тысячи файлов. Тикеты ссылаются на blob-ы по хешу (ticket_attachments).
+
+    max_bytes — общий лимит размера хранилища (0 — без лимита). Загрузка
+    резервирует место до начала скачивания (reserve), так что параллельные
+    загрузки вместе не превышают лимит; put или release снимают резерв.
+    Периодическая очистка удаляет ссылки тикетов, закрытых больше
+    retention_days дней назад, затем blob-ы, на которые больше никто
+    не ссылается (не раньше чем через grace секунд после последнего
+    использования — чтобы не удалить файл, который как раз скачивается).
+    """
+
+    def __init__(self, root: str = os.path.join("attachments", "blobs"), max_bytes: int = 0,
+                 retention_days: int = 90, grace: float = 3600, thumb_dir: str = THUMB_DIR):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.retention_days = retention_days
+        self.grace = grace
+        self.thumb_dir = thumb_dir
+        self._tmp_dir = os.path.join(root, ".tmp")
+        self._used = None
+        self._reserved = 0
+        self._sweep_requested = None
+        self._task = None
+
+    def path_for(self, sha256: str, ext: str = "") -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256 + ext)
+
+    def tmp_path(self) -> str:
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        return os.path.join(self._tmp_dir, f"{uuid.uuid4().hex}.part")
+
+    # ─── квота ────────────────────────────────────────────────────────────
+    async def load_usage(self):
+        if self._used is None:
+            self._used = await blob_usage()
+        return self._used
+
+    async def reserve(self, size: int) -> bool:
+        """Резервирует size байт под загрузку; при нехватке места просит внеочередную очистку"""
+        used = await self.load_usage()
+        if not self.max_bytes or used + self._reserved + size <= self.max_bytes:
+            self._reserved += size
+            return True
+        if self._sweep_requested:
+            self._sweep_requested.set()
+        return False
+
+    def release(self, size: int):
+        """Снимает резерв загрузки, которая не дошла до put"""
+        self._reserved -= size
+
+    # ─── запись и поиск ──────────────────────────────────────────────────
+    async def lookup(self, attachment_id: int):
+        """Путь к уже сохранённому содержимому вложения или None"""
+        blob = await find_attachment_blob(attachment_id)
+        if blob is None:
+            return None
+        path = self.path_for(blob.sha256, blob.ext)
+        return (path, blob.sha256) if os.path.exists(path) else None
+
+    async def put(self, tmp_path: str, sha256: str, size: int, filename: str, reserved: int = 0) -> str:
+        """
+        Переносит скачанный файл в хранилище; дубликат содержимого просто удаляется.
+        reserved — сколько байт было зарезервировано под загрузку (снимается здесь).
+        """
+        await self.load_usage()
+        blob, created = await put_blob(sha256, size, safe_ext(filename))
+        path = self.path_for(sha256, blob.ext)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        if created:
+            self._used += size
+        self._reserved -= reserved
+        return path
+
+    async def link(self, ticket_id: int, att, sha256: str):
+        await link_attachment(ticket_id, att.id, sha256, att.filename, att.url)
+
+    # ─── очистка ─────────────────────────────────────────────────────────
+    async def sweep(self) -> dict:
+        now = datetime.now()
+        expired = await expire_attachments(now - timedelta(days=self.retention_days))
+        removed, freed = 0, 0
+        while True:
+            blobs = await orphan_blobs(now - timedelta(seconds=self.grace))
+            if not blobs:
+                break
+            await asyncio.to_thread(self._remove_files, blobs)
+            await delete_blobs([b.sha256 for b in blobs])
+            removed += len(blobs)
+            freed += sum(b.size for b in blobs)
+        await asyncio.to_thread(self._remove_stale_tmp)
+        self._used = await blob_usage()
+        result = {"expired_links": expired, "removed_blobs": removed, "freed_bytes": freed}
+        if expired or removed:
+            log_activity("attachments_gc", **result)
+        return result
+
+    def _remove_files(self, blobs):
+        for blob in blobs:
+            name = blob.sha256 + blob.ext
+            for path in [self.path_for(blob.sha256, blob.ext),
+                         *glob.glob(os.path.join(self.thumb_dir, glob.escape(name) + ".*"))]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _remove_stale_tmp(self):
+        """Недокачанные файлы, брошенные при падении бота"""
+        if not os.path.isdir(self._tmp_dir):
+            return
+        deadline = time.time() - self.grace
+        for entry in os.scandir(self._tmp_dir):
+            if entry.stat().st_mtime < deadline:
+                os.remove(entry.path)
+
+    def start(self, interval: float):
+        """Периодическая очистка в фоне (однократный запуск)"""
+        if self._task is None:
+            self._sweep_requested = asyncio.Event()
+            self._task = asyncio.create_task(self._sweep_loop(interval))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _sweep_loop(self, interval: float):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                log_activity("attachments_gc_failed", error=repr(e))
+            self._sweep_requested.clear()
+            try:
+                await asyncio.wait_for(self._sweep_requested.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,106 @@
+# utils/channel_pool.py
+
+import uuid
+import asyncio
+from collections import deque
+
+import nextcord
+
+from utils.permissions import HIDDEN, BOT
+from utils.helpers import log_activity
+from utils.metrics import metrics
+
+# Не "ticket-": запасные каналы не должны считаться тикетами (см. utils.recorder)
+POOL_PREFIX = "pool-"
+
+
+class ChannelPool:
+    """
+    Запас заранее созданных скрытых каналов в категориях тикетов.
+
+    Новый тикет забирает канал из запаса одним запросом — переименование
+    и выдача прав (channel.edit), вместо создания канала, на которое Discord
+    вводит жёсткий лимит. Фоновая задача по одному досоздаёт каналы до size
+    на категорию с паузой spacing между запросами; при любой ошибке делает
+    паузу backoff и пробует снова. Если запас пуст, канал создаётся как раньше.
+
+    Запасные каналы называются "pool-…", поэтому после перезапуска бота
+    находятся по имени и переиспользуются.
+    """
+
+    def __init__(self, size: int = 0, spacing: float = 2.0, backoff: float = 60.0):
+        self.size = size
+        self.spacing = spacing
+        self.backoff = backoff
+        self._free = {}        # category_id -> deque(channel_id)
+        self._categories = {}  # category_id -> CategoryChannel
+        self._wanted = None
+        self._task = None
+
+    def start(self, categories):
+        """Подхватывает существующие запасные каналы и запускает досоздание (повторный вызов обновляет категории)"""
+        if not self.size:
+            return
+        for category in categories:
+            self._categories[category.id] = category
+            free = self._free.setdefault(category.id, deque())
+            known = set(free)
+            free.extend(ch.id for ch in category.text_channels
+                        if ch.name.startswith(POOL_PREFIX) and ch.id not in known)
+        if self._task is None:
+            self._wanted = asyncio.Event()
+            self._task = asyncio.create_task(self._refill_loop())
+        self._wanted.set()
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def claim(self, category, name: str, overwrites: dict):
+        """Канал тикета: из запаса (одно изменение) или, если запас пуст, новый"""
+        free = self._free.get(category.id)
+        while free:
+            channel = category.guild.get_channel(free.popleft())
+            self._wanted.set()
+            if channel is None:
+                continue
+            try:
+                # edit возвращает обновлённый канал: у кешированного объекта старые имя и права
+                edited = await channel.edit(name=name, overwrites=overwrites)
+                metrics.inc("ticket_channels_total", source="pool")
+                return edited or channel
+            except nextcord.NotFound:
+                continue
+        metrics.inc("ticket_channels_total", source="create")
+        return await category.create_text_channel(name, overwrites=overwrites)
+
+    def discard(self, channel_id: int):
+        """Запасной канал удалили вручную (on_guild_channel_delete)"""
+        for free in self._free.values():
+            if channel_id in free:
+                free.remove(channel_id)
+                self._wanted.set()
+                return
+
+    async def _refill_loop(self):
+        while True:
+            await self._wanted.wait()
+            self._wanted.clear()
+            for category_id, free in list(self._free.items()):
+                category = self._categories[category_id]
+                while len(free) < self.size:
+                    try:
+                        channel = await category.create_text_channel(
+                            f"{POOL_PREFIX}{uuid.uuid4().hex[:8]}",
+                            overwrites={category.guild.default_role: HIDDEN, category.guild.me: BOT},
+                        )
+                    except Exception as e:
+                        # Любая ошибка (API, сеть, сервер покинут) — пауза и повтор, а не конец задачи
+                        log_activity("channel_pool_refill_failed", category=category_id, error=repr(e))
+                        await asyncio.sleep(self.backoff)
+                        self._wanted.set()
+                        break
+                    free.append(channel.id)
+                    await asyncio.sleep(self.spacing)
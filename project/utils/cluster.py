@@ -0,0 +1,22 @@
+# utils/cluster.py
+
+
+def parse_shard_ids(spec: str) -> list:
+    """"0-3,6" -> [0, 1, 2, 3, 6]; пустая строка — пустой список"""
+    ids = []
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        start, _, end = part.partition("-")
+        ids.extend(range(int(start), int(end or start) + 1))
+    return ids
+
+
+def shard_ranges(shard_count: int, processes: int) -> list:
+    """Делит шарды 0..shard_count-1 на processes непрерывных диапазонов почти поровну"""
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    ranges, start = [], 0
+    for i in range(processes):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
@@ -0,0 +1,196 @@
+# utils/downloader.py
+
+import os
+import asyncio
+import hashlib
+import aiohttp
+
+from utils.blobstore import BlobStore
+from utils.helpers import log_activity
+from utils.metrics import metrics
+
+MB = 1024 * 1024
+
+
+class _Budget:
+    """Общий лимит байт на все вложения одного тикета"""
+    def __init__(self, limit: int):
+        self.left = limit
+
+    def take(self, n: int) -> bool:
+        if n > self.left:
+            return False
+        self.left -= n
+        return True
+
+    def refund(self, n: int):
+        self.left += n
+
+
+class _Claim:
+    """Сколько байт загрузка взяла из бюджета тикета и зарезервировала в хранилище"""
+    __slots__ = ("taken", "reserved")
+
+    def __init__(self, size: int = 0):
+        self.taken = self.reserved = size
+
+
+class DownloadBatch:
+    """
+    Загрузки одного тикета: каждое вложение начинает качаться сразу
+    при добавлении, не дожидаясь, пока будет собран весь список.
+    """
+    def __init__(self, downloader: "AttachmentDownloader", ticket_id: int = None):
+        self._downloader = downloader
+        self._ticket_id = ticket_id
+        self._budget = _Budget(downloader.max_ticket_size)
+        self._seen = set()
+        self._tasks = []
+
+    def add(self, att):
+        if att.id in self._seen:
+            return
+        self._seen.add(att.id)
+        self._tasks.append(asyncio.create_task(self._downloader._download(att, self._budget, self._ticket_id)))
+
+    async def results(self) -> list:
+        done = await asyncio.gather(*self._tasks)
+        return [r for r in done if r]
+
+
+class AttachmentDownloader:
+    """
+    Скачивает вложения тикета параллельно (не больше concurrency за раз)
+    через одну долгоживущую aiohttp-сессию. Файлы пишутся по частям (целиком
+    в памяти не держатся) и по ходу хешируются, а затем кладутся в BlobStore:
+    одинаковое содержимое хранится один раз. Вложения, уже сохранённые
+    раньше (по att.id), повторно не скачиваются.
+    """
+
+    def __init__(self,
+                 store: BlobStore = None,
+                 concurrency: int = 8,
+                 max_file_size: int = 25 * MB,
+                 max_ticket_size: int = 200 * MB,
+                 chunk_size: int = 256 * 1024):
+        self.store = store or BlobStore()
+        self.concurrency = concurrency
+        self.max_file_size = max_file_size
+        self.max_ticket_size = max_ticket_size
+        self.chunk_size = chunk_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=300, sock_read=30)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    def batch(self, ticket_id: int = None) -> "DownloadBatch":
+        """
+        Новая пачка загрузок для одного тикета (со своим лимитом размера).
+        С ticket_id вложения привязываются к тикету в хранилище.
+        """
+        return DownloadBatch(self, ticket_id)
+
+    async def download_all(self, attachments, ticket_id: int = None) -> list:
+        """
+        attachments: объекты с полями id, filename, url и (необязательно) size.
+        Возвращает список (local_path, original_url) в исходном порядке.
+        """
+        batch = self.batch(ticket_id)
+        for att in attachments:
+            batch.add(att)
+        return await batch.results()
+
+    async def _download(self, att, budget: _Budget, ticket_id: int = None):
+        with metrics.timer("attachment_download_seconds"):
+            result, outcome = await self._fetch(att, budget, ticket_id)
+        metrics.inc("attachment_downloads_total", outcome=outcome)
+        return result
+
+    async def _fetch(self, att, budget: _Budget, ticket_id: int = None) -> tuple:
+        """(результат для _download, исход для метрик)"""
+        size = getattr(att, "size", None)
+        outcome = "cached"
+
+        stored = await self.store.lookup(att.id)
+        if stored is None:
+            if size and (size > self.max_file_size or not budget.take(size)):
+                log_activity("attachment_skipped", attachment=att.id, size=size, reason="size_limit")
+                return None, "skipped"
+            if size and not await self.store.reserve(size):
+                budget.refund(size)
+                log_activity("attachment_skipped", attachment=att.id, size=size, reason="store_quota")
+                return None, "skipped"
+            claim = _Claim(size or 0)
+            try:
+                async with self._semaphore:
+                    stored = await self._stream_to_store(att, budget, claim)
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                log_activity("attachment_failed", attachment=att.id, error=repr(e))
+                return None, "failed"
+            finally:
+                # Неудачная загрузка возвращает взятое из бюджета тикета и квоты
+                if stored is None:
+                    budget.refund(claim.taken)
+                    self.store.release(claim.reserved)
+            if stored is None:
+                return None, "skipped"
+            outcome = "downloaded"
+
+        path, sha256 = stored
+        if ticket_id is not None:
+            await self.store.link(ticket_id, att, sha256)
+        return (path, att.url), outcome
+
+    async def _stream_to_store(self, att, budget: _Budget, claim: _Claim):
+        """
+        Скачивает во временный файл, считая sha256; возвращает (путь в хранилище, sha256).
+        Байты сверх заранее взятых (claim) берутся из бюджета и квоты по ходу загрузки.
+        """
+        tmp_path = self.store.tmp_path()
+        digest = hashlib.sha256()
+        async with self._get_session().get(att.url) as resp:
+            if resp.status != 200:
+                return None
+            f = await asyncio.to_thread(open, tmp_path, "wb")
+            written, reason = 0, None
+            try:
+                async for chunk in resp.content.iter_chunked(self.chunk_size):
+                    written += len(chunk)
+                    # Размер мог быть неизвестен заранее (или оказаться больше) — проверяем по ходу
+                    extra = written - claim.taken
+                    if written > self.max_file_size or (extra > 0 and not budget.take(extra)):
+                        reason = "size_limit"
+                    elif extra > 0:
+                        claim.taken += extra
+                        if await self.store.reserve(extra):
+                            claim.reserved += extra
+                        else:
+                            reason = "store_quota"
+                    if reason:
+                        break
+                    await asyncio.to_thread(_write_chunk, f, digest, chunk)
+            finally:
+                await asyncio.to_thread(f.close)
+        if reason:
+            os.remove(tmp_path)
+            log_activity("attachment_skipped", attachment=att.id, reason=reason)
+            return None
+        sha256 = digest.hexdigest()
+        metrics.inc("attachment_bytes_total", written)
+        return await self.store.put(tmp_path, sha256, written, att.filename, claim.reserved), sha256
+
+
+def _write_chunk(f, digest, chunk: bytes):
+    f.write(chunk)
+    digest.update(chunk)
@@ -0,0 +1,151 @@
+# utils/exporters.py
+
+import os
+import gzip
+import json
+import base64
+import html
+
+try:
+    import zstandard
+except ImportError:  # zstd необязателен — без него архив сжимается gzip
+    zstandard = None
+
+EXPORT_DIR = "logs"
+IMAGE_EXT = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+
+# name -> функция (ticket_id, author_name, issue_description, messages, attachments) -> путь
+EXPORTERS = {}
+
+
+def exporter(name: str):
+    """Регистрирует формат транскрипта под именем name"""
+    def register(fn):
+        EXPORTERS[name] = fn
+        return fn
+    return register
+
+
+def export(fmt: str, ticket_id: str, author_name: str, issue_description: str,
+           messages, attachments: list) -> str:
+    try:
+        fn = EXPORTERS[fmt]
+    except KeyError:
+        raise ValueError(f"unknown transcript format: {fmt}")
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    return fn(ticket_id, author_name, issue_description, messages, attachments)
+
+
+# ─── JSON lines (архив) ───────────────────────────────────────────────────
+def _open_archive(path: str, mode: str):
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed")
+        if "w" in mode:
+            return zstandard.open(path, "wt", encoding="utf-8", cctx=zstandard.ZstdCompressor(level=6))
+        return zstandard.open(path, "rt", encoding="utf-8")
+    return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=6)
+
+
+@exporter("jsonl")
+def export_jsonl(ticket_id, author_name, issue_description, messages, attachments) -> str:
+    """
+    Сжатый архив: первая строка — заголовок тикета, дальше по строке на сообщение.
+    Из архива потом можно отрендерить любой другой формат (read_archive).
+    """
+    ext = ".jsonl.zst" if zstandard else ".jsonl.gz"
+    path = os.path.join(EXPORT_DIR, f"ticket_{ticket_id}{ext}")
+    tmp = path + ".tmp" + ext
+    with _open_archive(tmp, "w") as f:
+        header = {"ticket": ticket_id, "author": author_name, "issue": issue_description,
+                  "attachments": [list(a) for a in attachments]}
+        f.write(json.dumps(header, ensure_ascii=False) + "\n")
+        for msg in messages:
+            f.write(json.dumps(msg, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+    return path
+
+
+# Расширения архива в порядке предпочтения; временные файлы прерванной
+# выгрузки (*.tmp.*) под них не подходят
+ARCHIVE_EXT = (".jsonl.zst", ".jsonl.gz")
+
+
+def find_archive(ticket_id) -> str:
+    for ext in ARCHIVE_EXT:
+        if ext.endswith(".zst") and zstandard is None:
+            continue  # прочитать .zst без zstandard нельзя
+        path = os.path.join(EXPORT_DIR, f"ticket_{ticket_id}{ext}")
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def read_archive(path: str):
+    """Возвращает (заголовок, генератор сообщений) из архива export_jsonl"""
+    f = _open_archive(path, "r")
+    header = json.loads(f.readline())
+
+    def messages():
+        with f:
+            for line in f:
+                yield json.loads(line)
+    return header, messages()
+
+
+# ─── HTML ─────────────────────────────────────────────────────────────────
+_HTML_HEAD = """<!DOCTYPE html>
+<html lang="ru"><head><meta charset="utf-8"><title>Тикет #{ticket}</title>
+<style>
+body{{font-family:sans-serif;max-width:900px;margin:2em auto;color:#222}}
+.msg{{margin:.6em 0}}.author{{font-weight:bold}}.content{{white-space:pre-wrap;margin-left:1em}}
+.issue{{white-space:pre-wrap;background:#f4f4f4;padding:.6em}}img{{max-width:100%}}
+</style></head><body>
+<h1>Тикет #{ticket}</h1>
+<p>Автор тикета: {author}</p>
+<h2>Описание проблемы</h2><div class="issue">{issue}</div>
+<h2>Переписка</h2>
+"""
+
+
+@exporter("html")
+def export_html(ticket_id, author_name, issue_description, messages, attachments) -> str:
+    """Одностраничный HTML без внешних ресурсов: картинки встроены уменьшенными копиями"""
+    path = os.path.join(EXPORT_DIR, f"ticket_{ticket_id}.html")
+    esc = html.escape
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(_HTML_HEAD.format(ticket=esc(str(ticket_id)), author=esc(author_name),
+                                  issue=esc(issue_description)))
+        for msg in messages:
+            f.write(f'<div class="msg"><div class="author">{esc(msg["author"])}:</div>'
+                    f'<div class="content">{esc(msg["content"])}</div></div>\n')
+        if attachments:
+            f.write("<h2>Вложения</h2>\n")
+        for local_path, url in attachments:
+            f.write(_html_attachment(local_path, url))
+        f.write("</body></html>\n")
+    return path
+
+
+def _html_attachment(local_path: str, url: str) -> str:
+    # Локальный файл назван по хешу содержимого — показываем исходное имя из URL
+    name = url.split("?", 1)[0].rsplit("/", 1)[-1] or os.path.basename(local_path)
+    link = f'<p><a href="{html.escape(url, quote=True)}">{html.escape(name)}</a></p>\n'
+    if os.path.splitext(local_path)[1].lower() not in IMAGE_EXT:
+        return link
+    from utils.images import prepare_image  # PIL — только когда есть картинки
+    try:
+        thumb, _, _ = prepare_image(local_path, 640, 480, dpi=96)
+    except Exception:
+        return link
+    mime = "image/png" if thumb.endswith(".png") else "image/jpeg"
+    with open(thumb, "rb") as f:
+        data = base64.b64encode(f.read()).decode("ascii")
+    return f'<p><img src="data:{mime};base64,{data}" alt=""></p>\n' + link
+
+
+# ─── PDF ──────────────────────────────────────────────────────────────────
+@exporter("pdf")
+def export_pdf(ticket_id, author_name, issue_description, messages, attachments) -> str:
+    from utils.pdf_generator import generate_pdf
+    return generate_pdf(ticket_id, author_name, issue_description, messages, attachments)
@@ -1,8 +1,122 @@
+import os
+import json
+import time
+import queue
+import atexit
+import threading
 from datetime import datetime
 
+from utils.metrics import metrics
+
+LOG_FILE = os.path.join("logs", "activity.log")
+
+
 def validate_rating(rating: int):
     return 1 <= rating <= 5
 
-def log_activity(action: str):
-    with open("logs/activity.log", "a") as f:
-        f.write(f"{datetime.now()} - {action}\n")
+
+class ActivityLogger:
+    """
+    Журнал действий в формате JSON lines.
+
+    log() только кладёт запись в очередь; открытие файла, запись и ротацию
+    выполняет фоновый поток, сбрасывая записи пачками — не чаще раза
+    в flush_interval секунд или по накоплении batch_size записей.
+    Файл ротируется при превышении max_bytes или по истечении
+    rotate_interval секунд (activity.log → activity.log.1 → …).
+    """
+
+    _STOP = object()
+
+    def __init__(self, path: str = LOG_FILE,
+                 max_bytes: int = 10 * 1024 * 1024,
+                 rotate_interval: float = 24 * 3600,
+                 backup_count: int = 5,
+                 flush_interval: float = 1.0,
+                 batch_size: int = 500):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._file = None
+        self._opened_at = 0.0
+
+    def log(self, action: str, **fields):
+        if self._thread is None:
+            self._start()
+        self._queue.put({"ts": datetime.now().isoformat(), "action": action, **fields})
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="activity-log", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def close(self):
+        """Дописывает всё из очереди и останавливает поток"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self._write(batch)
+                except OSError as e:
+                    print(f"[ERROR] activity log write failed: {e}")
+        if self._file:
+            self._file.close()
+
+    def _write(self, batch: list):
+        if self._file is None or self._should_rotate():
+            self._rotate()
+        self._file.write("".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in batch))
+        self._file.flush()
+
+    def _should_rotate(self) -> bool:
+        return (self._file.tell() >= self.max_bytes
+                or time.time() - self._opened_at >= self.rotate_interval)
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+            for i in range(self.backup_count - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            if self.backup_count > 0:
+                os.replace(self.path, f"{self.path}.1")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._opened_at = time.time()
+
+
+_logger = ActivityLogger()
+
+
+def log_activity(action: str, **fields):
+    """Записывает событие в logs/activity.log (асинхронно, через фоновый поток)"""
+    with metrics.timer("log_activity_seconds"):
+        _logger.log(action, **fields)
@@ -0,0 +1,55 @@
+# utils/images.py
+
+import os
+from PIL import Image
+
+THUMB_DIR = os.path.join("attachments", ".thumbs")
+DEFAULT_DPI = 150
+JPEG_QUALITY = 80
+
+
+def prepare_image(local_path: str, max_w: float, max_h: float, dpi: int = DEFAULT_DPI,
+                  cache_dir: str = THUMB_DIR):
+    """
+    Готовит картинку для вставки в PDF в рамку max_w × max_h (в пунктах).
+
+    Изображение уменьшается до разрешения dpi (для JPEG — прямо при
+    декодировании через Image.draft), перекодируется в компактный JPEG
+    (или PNG, если есть прозрачность) и кладётся в кеш под именем файла
+    из хранилища ("<sha256><ext>"), так что повторный экспорт тикета — и та же
+    картинка в другом тикете — его не пересчитывают.
+
+    Возвращает (путь к уменьшенной копии, ширина, высота в пунктах).
+    """
+    box = (max(1, int(max_w / 72 * dpi)), max(1, int(max_h / 72 * dpi)))
+    key = f"{os.path.basename(local_path)}.{box[0]}x{box[1]}"
+
+    for ext in (".jpg", ".png"):
+        cached = os.path.join(cache_dir, key + ext)
+        if os.path.exists(cached):
+            with Image.open(cached) as img:  # читается только заголовок
+                return cached, *_points(img.size, dpi)
+
+    with Image.open(local_path) as img:
+        if img.format == "JPEG":
+            # Декодер JPEG сам уменьшает картинку в 2/4/8 раз — намного быстрее полного декодирования
+            img.draft("RGB", box)
+        img.seek(0)  # GIF/анимированные форматы — первый кадр
+        transparent = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+        img = img.convert("RGBA" if transparent else "RGB")
+        img.thumbnail(box, Image.Resampling.LANCZOS)
+
+        os.makedirs(cache_dir, exist_ok=True)
+        ext = ".png" if transparent else ".jpg"
+        cached = os.path.join(cache_dir, key + ext)
+        tmp = f"{cached}.{os.getpid()}.tmp"
+        if transparent:
+            img.save(tmp, "PNG", optimize=True)
+        else:
+            img.save(tmp, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+        os.replace(tmp, cached)
+        return cached, *_points(img.size, dpi)
+
+
+def _points(size_px: tuple, dpi: int) -> tuple:
+    return size_px[0] * 72 / dpi, size_px[1] * 72 / dpi
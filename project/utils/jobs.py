@@ -0,0 +1,125 @@
+# utils/jobs.py
+
+import json
+import asyncio
+import traceback
+from datetime import datetime, timedelta
+
+from database.async_crud import enqueue_job, claim_job, save_job, renew_job_lease
+from utils.helpers import log_activity
+from utils.metrics import metrics
+
+
+class RetryLater(Exception):
+    """Этап пока не может выполниться — повторить через delay секунд (не считается ошибкой)"""
+    def __init__(self, delay: float):
+        super().__init__(f"retry in {delay}s")
+        self.delay = delay
+
+
+class JobQueue:
+    """
+    Постоянная очередь задач (таблица jobs) с воркерами-корутинами.
+
+    Задача проходит этапы stages по порядку; после каждого этапа текущий
+    этап и payload сохраняются в БД, поэтому после перезапуска бота задача
+    продолжается с того этапа, на котором прервалась. Этапы должны быть
+    идемпотентны: этап, прерванный посередине, будет выполнен заново.
+
+    stages — список (имя, async fn(payload: dict)); fn может менять payload.
+    Ошибка этапа → повтор с экспоненциальной задержкой backoff·2^n,
+    после max_attempts попыток задача помечается failed.
+
+    Взятая задача арендуется на lease секунд, воркер продлевает аренду,
+    пока её выполняет. Задачу, чья аренда истекла (процесс упал или был
+    перезапущен), забирает любой процесс с той же очередью; задачи живых
+    процессов кластера не трогаются.
+    """
+
+    def __init__(self, kind: str, stages: list, workers: int = 2, max_attempts: int = 5,
+                 backoff: float = 5.0, poll_interval: float = 5.0, lease: float = 60.0):
+        self.kind = kind
+        self.stages = stages
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self._order = [name for name, _ in stages]
+        self._handlers = dict(stages)
+        self._wakeup = None
+        self._tasks = []
+
+    async def enqueue(self, payload: dict) -> int:
+        job = await enqueue_job(self.kind, self._order[0], json.dumps(payload, ensure_ascii=False))
+        if self._wakeup:
+            self._wakeup.set()
+        return job.id
+
+    async def start(self):
+        """Запускает воркеры (однократно); прерванные задачи они заберут по истечении аренды"""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            job = await claim_job(self.kind, self.lease)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heartbeat = asyncio.create_task(self._heartbeat(job.id))
+            try:
+                await self._run(job)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                heartbeat.cancel()
+
+    async def _heartbeat(self, job_id):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await renew_job_lease(job_id, self.lease)
+            except Exception:
+                traceback.print_exc()
+
+    async def _run(self, job):
+        payload = json.loads(job.payload)
+        stage = job.stage
+        while stage is not None:
+            try:
+                with metrics.timer("job_stage_seconds", kind=self.kind, stage=stage):
+                    await self._handlers[stage](payload)
+            except RetryLater as later:
+                return await self._reschedule(job.id, stage, payload, later.delay, job.attempts)
+            except Exception as e:
+                attempts = job.attempts + 1
+                metrics.inc("job_stage_errors_total", kind=self.kind, stage=stage)
+                log_activity("job_error", kind=self.kind, job=job.id, stage=stage,
+                             attempt=attempts, error=repr(e))
+                if attempts >= self.max_attempts:
+                    return await save_job(job.id, stage=stage, payload=json.dumps(payload, ensure_ascii=False),
+                                          status="failed", attempts=attempts, last_error=repr(e))
+                return await self._reschedule(job.id, stage, payload,
+                                              self.backoff * 2 ** (attempts - 1), attempts, repr(e))
+            index = self._order.index(stage) + 1
+            stage = self._order[index] if index < len(self._order) else None
+            await save_job(job.id, stage=stage or "done", status="running" if stage else "done",
+                           payload=json.dumps(payload, ensure_ascii=False))
+
+    async def _reschedule(self, job_id, stage, payload, delay, attempts, error=None):
+        await save_job(job_id, stage=stage, status="pending", attempts=attempts, last_error=error,
+                       payload=json.dumps(payload, ensure_ascii=False),
+                       next_run_at=datetime.now() + timedelta(seconds=delay))
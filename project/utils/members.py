@@ -0,0 +1,52 @@
+# utils/members.py
+
+from collections import OrderedDict
+
+import nextcord
+
+
+class MemberCache:
+    """
+    Небольшой LRU недавно встречавшихся участников для режима без кеша
+    участников nextcord (LEAN_MEMBER_CACHE).
+
+    Заполняется из взаимодействий и сообщений — в них Discord присылает
+    участника целиком, с ролями. Если участника нет ни в кеше nextcord,
+    ни здесь, он запрашивается через API (guild.fetch_member) и запоминается.
+    """
+
+    def __init__(self, maxsize: int = 5000):
+        self.maxsize = maxsize
+        self._members = OrderedDict()
+
+    def remember(self, member):
+        if not isinstance(member, nextcord.Member):
+            return
+        key = (member.guild.id, member.id)
+        self._members[key] = member
+        self._members.move_to_end(key)
+        if len(self._members) > self.maxsize:
+            self._members.popitem(last=False)
+
+    def forget(self, guild_id: int, user_id: int):
+        self._members.pop((guild_id, user_id), None)
+
+    async def get(self, guild, user_id: int):
+        """Участник сервера или None, если его там больше нет"""
+        member = guild.get_member(user_id)
+        if member is not None:
+            return member
+        key = (guild.id, user_id)
+        member = self._members.get(key)
+        if member is not None:
+            self._members.move_to_end(key)
+            return member
+        try:
+            member = await guild.fetch_member(user_id)
+        except nextcord.NotFound:
+            return None
+        self.remember(member)
+        return member
+
+    def __len__(self):
+        return len(self._members)
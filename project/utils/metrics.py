@@ -0,0 +1,231 @@
+# utils/metrics.py
+
+import math
+import time
+import asyncio
+import bisect
+import threading
+
+# Границы корзин гистограмм в секундах — от быстрых запросов к БД до рендера PDF
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count", "max")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * (buckets + 1)  # последняя корзина — +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+
+class _Timer:
+    """Замер длительности блока: with metrics.timer(...) / async with metrics.timer(...)"""
+    __slots__ = ("_metrics", "_name", "_labels", "_start")
+
+    def __init__(self, metrics, name, labels):
+        self._metrics, self._name, self._labels = metrics, name, labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metrics.observe(self._name, time.perf_counter() - self._start, **self._labels)
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        self.__exit__(*exc)
+
+
+class Metrics:
+    """
+    Счётчики, гистограммы и gauge-и в памяти процесса.
+
+    Метрика — имя плюс набор меток (stage="render"); каждая комбинация
+    меток хранится отдельно. Запись — несколько операций со списком под
+    блокировкой, её можно вызывать из любого потока (поток БД, логгер).
+    Отдаются в текстовом формате Prometheus (render) и сводкой для !perf.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}    # (name, labels) -> число
+        self._histograms = {}  # (name, labels) -> _Histogram
+        self._gauges = {}      # name -> fn() -> число или [(labels: dict, число)]
+        self._help = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted(labels.items()))
+
+    def describe(self, name: str, text: str):
+        self._help[name] = text
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = _Histogram(len(self.buckets))
+            hist.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            hist.sum += seconds
+            hist.count += 1
+            if seconds > hist.max:
+                hist.max = seconds
+
+    def gauge(self, name: str, fn):
+        """fn вызывается при каждом чтении метрик; возвращает число или [(метки, число)]"""
+        self._gauges[name] = fn
+
+    def timer(self, name: str, **labels) -> _Timer:
+        return _Timer(self, name, labels)
+
+    # ─── чтение ──────────────────────────────────────────────────────────
+    def _quantile(self, hist: _Histogram, q: float) -> float:
+        """Оценка квантиля по корзинам (линейная интерполяция внутри корзины)"""
+        rank = q * hist.count
+        seen, lower = 0, 0.0
+        for upper, n in zip(self.buckets + (hist.max,), hist.counts):
+            if n and seen + n >= rank:
+                return min(lower + (upper - lower) * (rank - seen) / n, hist.max)
+            seen += n
+            lower = upper
+        return hist.max
+
+    def _gauge_values(self) -> list:
+        values = []
+        for name, fn in self._gauges.items():
+            try:
+                value = fn()
+            except Exception:
+                continue
+            if isinstance(value, list):
+                values.extend((name, tuple(sorted(labels.items())), v) for labels, v in value)
+            elif value is not None:
+                values.append((name, (), value))
+        return values
+
+    def summary(self) -> dict:
+        """{"histograms": {(name, labels): {count, avg, p50, p99, max}}, "counters": ..., "gauges": ...}"""
+        with self._lock:
+            histograms = {
+                key: {"count": h.count, "avg": h.sum / h.count, "p50": self._quantile(h, 0.5),
+                      "p99": self._quantile(h, 0.99), "max": h.max}
+                for key, h in self._histograms.items() if h.count
+            }
+            counters = dict(self._counters)
+        gauges = {(name, labels): v for name, labels, v in self._gauge_values()}
+        return {"histograms": histograms, "counters": counters, "gauges": gauges}
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus"""
+        lines = []
+        typed = set()
+
+        def header(name, kind):
+            if name in typed:
+                return
+            typed.add(name)
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = [(key, list(h.counts), h.sum, h.count) for key, h in sorted(self._histograms.items())]
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), counts, total, count in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        for name, labels, value in sorted(self._gauge_values()):
+            header(name, "gauge")
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return "{" + inner + "}"
+
+
+def _number(value) -> str:
+    # Prometheus пишет NaN/±Inf иначе, чем str(float)
+    if isinstance(value, float) and not math.isfinite(value):
+        return "NaN" if math.isnan(value) else ("+Inf" if value > 0 else "-Inf")
+    return str(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Общий экземпляр процесса
+metrics = Metrics()
+
+
+class LoopLagMonitor:
+    """
+    Задержка event loop: насколько позже запланированного просыпается
+    корутина, которая спит interval секунд. Большие значения означают,
+    что какой-то код блокирует цикл.
+    """
+
+    def __init__(self, registry: Metrics = metrics, interval: float = 0.5):
+        self.metrics = registry
+        self.interval = interval
+        self.last = 0.0
+        self._task = None
+        registry.describe("event_loop_lag_seconds", "Задержка пробуждения корутин в event loop")
+        registry.gauge("event_loop_lag_last_seconds", lambda: self.last)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, loop.time() - start - self.interval)
+            self.metrics.observe("event_loop_lag_seconds", self.last)
+
+
+async def serve_metrics(registry: Metrics = metrics, host: str = "127.0.0.1", port: int = 9108):
+    """HTTP-эндпоинт /metrics для Prometheus; возвращает AppRunner (runner.cleanup() — остановка)"""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -7,179 +7,226 @@ from reportlab.lib.pagesizes import A4
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.units import mm
-from reportlab.lib.utils import ImageReader
-from PIL import Image
-import textwrap
+
+from utils.images import prepare_image
 
 # Папка с шрифтами (обязательно положите DejaVuSans.ttf туда)
 FONT_DIR = os.path.join(os.path.dirname(__file__), "fonts")
+FONT = "DejaVuSans"
+
+PAGE_W, PAGE_H = A4
+LEFT = 15 * mm
+RIGHT = PAGE_W - 15 * mm
+TOP = PAGE_H - 20 * mm
+BOTTOM = 20 * mm
+LINE = 5 * mm
+
+IMAGE_EXT = (".png", ".jpg", ".jpeg", ".gif")
+VIDEO_EXT = (".mp4", ".mov", ".webm")
+
+# Ширины символов при размере 1 pt, по шрифтам: stringWidth для каждого
+# символа вызывается один раз за процесс, дальше строка меряется суммой
+_WIDTHS = {}
+
+
+def load_fonts():
+    """
+    Регистрирует шрифт DejaVuSans для кириллицы. Разбор TTF занимает заметное
+    время, поэтому выполняется при первом PDF (или в воркере рендера при
+    старте, см. utils.render_service), а не при импорте.
+    """
+    if FONT not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(FONT, os.path.join(FONT_DIR, "DejaVuSans.ttf")))
+
+
+def text_width(text: str, font: str = FONT, size: float = 10) -> float:
+    widths = _WIDTHS.setdefault(font, {})
+    try:
+        return sum(map(widths.__getitem__, text)) * size
+    except KeyError:
+        load_fonts()
+        for ch in set(text).difference(widths):
+            widths[ch] = pdfmetrics.stringWidth(ch, font, 1000) / 1000
+        return sum(map(widths.__getitem__, text)) * size
+
+
+def wrap_text(text: str, max_width: float, font: str = FONT, size: float = 10):
+    """Переносит строку по словам так, чтобы каждая часть помещалась в max_width"""
+    for paragraph in text.splitlines() or [""]:
+        if text_width(paragraph, font, size) <= max_width:
+            yield paragraph
+            continue
+        line, line_w = "", 0.0
+        space_w = text_width(" ", font, size)
+        for word in paragraph.split(" "):
+            word_w = text_width(word, font, size)
+            if line and line_w + space_w + word_w <= max_width:
+                line, line_w = f"{line} {word}", line_w + space_w + word_w
+                continue
+            if line:
+                yield line
+            # Слово длиннее строки (например, ссылка) режем по символам
+            while word_w > max_width:
+                cut = _fit_chars(word, max_width, font, size)
+                yield word[:cut]
+                word = word[cut:]
+                word_w = text_width(word, font, size)
+            line, line_w = word, word_w
+        if line:
+            yield line
+
+
+def _fit_chars(word: str, max_width: float, font: str, size: float) -> int:
+    width = 0.0
+    for i, ch in enumerate(word):
+        width += text_width(ch, font, size)
+        if width > max_width:
+            return max(i, 1)
+    return len(word)
+
+
+class _Layout:
+    """Курсор по страницам: переносит на новую страницу и рисует шаблон страницы"""
+
+    def __init__(self, c: canvas.Canvas, ticket_id: str):
+        self.c = c
+        self.page = 1
+        self.y = TOP
+        # Колонтитулы одинаковы на всех страницах — описываем их один раз
+        # как form XObject и дальше только ссылаемся на него
+        c.beginForm("page_template")
+        c.setFont(FONT, 8)
+        c.setFillGray(0.5)
+        c.drawString(LEFT, PAGE_H - 10 * mm, f"Тикет #{ticket_id}")
+        c.line(LEFT, PAGE_H - 11 * mm, RIGHT, PAGE_H - 11 * mm)
+        c.line(LEFT, BOTTOM - 5 * mm, RIGHT, BOTTOM - 5 * mm)
+        c.endForm()
+        self._decorate()
+
+    def _decorate(self):
+        self.c.doForm("page_template")
+        self.c.setFont(FONT, 8)
+        self.c.setFillGray(0.5)
+        self.c.drawRightString(RIGHT, BOTTOM - 9 * mm, str(self.page))
+        self.c.setFillGray(0)
+
+    def new_page(self):
+        self.c.showPage()
+        self.page += 1
+        self.y = TOP
+        self._decorate()
+
+    def ensure(self, height: float):
+        if self.y - height < BOTTOM:
+            self.new_page()
+
+    def text(self, line: str, size: float = 10, indent: float = 0, step: float = LINE):
+        self.ensure(step)
+        self.c.setFont(FONT, size)
+        self.c.drawString(LEFT + indent, self.y, line)
+        self.y -= step
+
+    def paragraph(self, text: str, size: float = 10, indent: float = 0):
+        for line in wrap_text(text, RIGHT - LEFT - indent, FONT, size):
+            self.text(line, size, indent)
+
+    def link(self, label: str, url: str, size: float = 10):
+        """Текст «label url» с кликабельной ссылкой, перенесённый по ширине"""
+        offset = len(label) + 1
+        pos = 0
+        for line in wrap_text(f"{label} {url}", RIGHT - LEFT, FONT, size):
+            self.ensure(LINE)
+            self.c.setFont(FONT, size)
+            self.c.drawString(LEFT, self.y, line)
+            # Часть строки, которая относится к url
+            start = max(offset - pos, 0)
+            if start < len(line):
+                px = LEFT + text_width(line[:start], FONT, size)
+                pw = text_width(line[start:], FONT, size)
+                self.c.linkURL(url, (px, self.y - 2, px + pw, self.y + size - 2), relative=0)
+            pos += len(line) + 1
+            self.y -= LINE
 
-# Регистрируем шрифт DejaVuSans для кириллицы
-pdfmetrics.registerFont(
-    TTFont("DejaVuSans", os.path.join(FONT_DIR, "DejaVuSans.ttf"))
-)
 
 def generate_pdf(ticket_id: str,
                  author_name: str,
                  issue_description: str,
-                 messages: list,
+                 messages,
                  attachments: list):
     """
     Генерирует PDF:
       - ticket_id: идентификатор (имя канала),
       - author_name: ник создателя тикета,
       - issue_description: исходное описание проблемы,
-      - messages: список словарей {'author': str, 'content': str},
+      - messages: итерируемый набор словарей {'author': str, 'content': str}
+        (может быть генератором — читается один раз),
       - attachments: список кортежей (local_path, original_url).
     Для каждого вложения:
       - Если расширение .png/.jpg/.jpeg/.gif → вставляем как изображение (для GIF берётся первый кадр).
       - Если расширение видео (.mp4/.mov/.webm) → выводим кликабельную ссылку на original_url,
         а внизу помечаем "Видео сохранено локально: имя_файла".
       - Остальные файлы → просто текстом "Вложение: <original_url>".
+    Строки переносятся по реальной ширине текста в шрифте.
+
+    Ограничение: reportlab держит все страницы документа в памяти до
+    c.save(), поэтому память растёт с длиной транскрипта. pageCompression
+    только уменьшает её — потоки страниц хранятся сжатыми, — но не делает
+    её ограниченной. Для очень длинных тикетов лучше формат html/jsonl.
     """
+    load_fonts()
     os.makedirs("logs", exist_ok=True)
     now_str = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"logs/ticket_{ticket_id}_{now_str}.pdf"
-    c = canvas.Canvas(filename, pagesize=A4)
-    width, height = A4
-
-    left = 15 * mm
-    right = width - 15 * mm
-    y = height - 20 * mm
+    c = canvas.Canvas(filename, pagesize=A4, pageCompression=1)
+    page = _Layout(c, ticket_id)
 
     # Заголовок
-    c.setFont("DejaVuSans", 16)
-    c.drawCentredString(width / 2, y, f"Тикет #{ticket_id}")
-    y -= 10 * mm
+    c.setFont(FONT, 16)
+    c.drawCentredString(PAGE_W / 2, page.y, f"Тикет #{ticket_id}")
+    page.y -= 10 * mm
 
     # Автор и описание
-    c.setFont("DejaVuSans", 12)
-    c.drawString(left, y, f"Автор тикета: {author_name}")
-    y -= 7 * mm
-
-    c.drawString(left, y, "Описание проблемы:")
-    y -= 7 * mm
-
-    # Описание проблемы с переносами по ~80 символов
-    text_obj = c.beginText(left, y)
-    text_obj.setFont("DejaVuSans", 11)
-    for line in issue_description.splitlines():
-        wrapped = textwrap.wrap(line, width=80)
-        for part in wrapped:
-            text_obj.textLine(part)
-            y -= 5 * mm
-    c.drawText(text_obj)
-    y = text_obj.getY() - 10 * mm
+    page.text(f"Автор тикета: {author_name}", size=12, step=7 * mm)
+    page.text("Описание проблемы:", size=12, step=7 * mm)
+    page.paragraph(issue_description, size=11)
+    page.y -= 5 * mm
 
     # Переписка
-    c.setFont("DejaVuSans", 12)
-    c.drawString(left, y, "Переписка:")
-    y -= 7 * mm
-
-    c.setFont("DejaVuSans", 10)
+    page.text("Переписка:", size=12, step=7 * mm)
     for msg in messages:
-        if y < 50 * mm:
-            c.showPage()
-            y = height - 20 * mm
-            c.setFont("DejaVuSans", 10)
-
-        author_line = f"{msg['author']}:"
-        c.drawString(left, y, author_line)
-        y -= 5 * mm
-
-        wrapped = textwrap.wrap(msg["content"], width=80)
-        for part in wrapped:
-            if y < 50 * mm:
-                c.showPage()
-                y = height - 20 * mm
-                c.setFont("DejaVuSans", 10)
-            c.drawString(left + 10, y, part)
-            y -= 5 * mm
-
-        y -= 3 * mm
+        page.ensure(2 * LINE)
+        page.text(f"{msg['author']}:")
+        if msg["content"]:
+            page.paragraph(msg["content"], indent=10)
+        page.y -= 3 * mm
 
     # Вложения
     if attachments:
-        if y < 60 * mm:
-            c.showPage()
-            y = height - 20 * mm
-        c.setFont("DejaVuSans", 12)
-        c.drawString(left, y, "Вложения:")
-        y -= 10 * mm
+        page.ensure(40 * mm)
+        page.text("Вложения:", size=12, step=10 * mm)
 
         for local_path, orig_url in attachments:
             ext = os.path.splitext(local_path)[1].lower()
-            # Если изображение
-            if ext in (".png", ".jpg", ".jpeg", ".gif"):
-                if y < 60 * mm:
-                    c.showPage()
-                    y = height - 20 * mm
-                try:
-                    img = Image.open(local_path)
-                    # Если GIF — берём первый кадр
-                    if ext == ".gif":
-                        img = img.convert("RGBA")
-                    max_w = right - left
-                    max_h = 100 * mm
-                    img.thumbnail((max_w, max_h), Image.ANTIALIAS)
-                    img_reader = ImageReader(img)
-                    iw, ih = img.size
-
-                    if y - ih < 50 * mm:
-                        c.showPage()
-                        y = height - 20 * mm
-
-                    c.drawImage(img_reader, left, y - ih, width=iw, height=ih)
-                    y -= ih + 10 * mm
-                except Exception:
-                    c.setFont("DejaVuSans", 10)
-                    c.drawString(left, y, f"❌ Ошибка вставки изображения: {os.path.basename(local_path)}")
-                    y -= 7 * mm
-
-            # Если видео
-            elif ext in (".mp4", ".mov", ".webm"):
-                if y < 50 * mm:
-                    c.showPage()
-                    y = height - 20 * mm
-                c.setFont("DejaVuSans", 10)
-                text = f"Видео: {orig_url}"
-                wrapped = textwrap.wrap(text, width=80)
-                for part in wrapped:
-                    if y < 50 * mm:
-                        c.showPage()
-                        y = height - 20 * mm
-                        c.setFont("DejaVuSans", 10)
-                    c.drawString(left, y, part)
-                    if orig_url in part:
-                        prefix = part.split(orig_url)[0]
-                        px = left + pdfmetrics.stringWidth(prefix, "DejaVuSans", 10)
-                        pw = pdfmetrics.stringWidth(orig_url, "DejaVuSans", 10)
-                        c.linkURL(orig_url, (px, y - 2, px + pw, y + 8), relative=0)
-                    y -= 5 * mm
-                c.drawString(left + 10, y, f"(Сохранено локально: {os.path.basename(local_path)})")
-                y -= 10 * mm
-
-            # Иные файлы
+            if ext in IMAGE_EXT:
+                _draw_image(page, local_path)
+            elif ext in VIDEO_EXT:
+                page.link("Видео:", orig_url)
+                page.text(f"(Сохранено локально: {os.path.basename(local_path)})", indent=10)
+                page.y -= 5 * mm
             else:
-                if y < 50 * mm:
-                    c.showPage()
-                    y = height - 20 * mm
-                c.setFont("DejaVuSans", 10)
-                text = f"Вложение: {orig_url}"
-                wrapped = textwrap.wrap(text, width=80)
-                for part in wrapped:
-                    if y < 50 * mm:
-                        c.showPage()
-                        y = height - 20 * mm
-                        c.setFont("DejaVuSans", 10)
-                    c.drawString(left, y, part)
-                    if orig_url in part:
-                        prefix = part.split(orig_url)[0]
-                        px = left + pdfmetrics.stringWidth(prefix, "DejaVuSans", 10)
-                        pw = pdfmetrics.stringWidth(orig_url, "DejaVuSans", 10)
-                        c.linkURL(orig_url, (px, y - 2, px + pw, y + 8), relative=0)
-                    y -= 5 * mm
-                y -= 5 * mm
+                page.link("Вложение:", orig_url)
+                page.y -= 5 * mm
 
     c.save()
     return filename
+
+
+def _draw_image(page: _Layout, local_path: str):
+    try:
+        path, iw, ih = prepare_image(local_path, RIGHT - LEFT, 100 * mm)
+        page.ensure(ih)
+        # JPEG встраивается как есть (без перекодирования), PNG — со сжатием
+        page.c.drawImage(path, LEFT, page.y - ih, width=iw, height=ih, mask="auto")
+        page.y -= ih + 10 * mm
+    except Exception:
+        page.text(f"❌ Ошибка вставки изображения: {os.path.basename(local_path)}", step=7 * mm)
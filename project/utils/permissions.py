@@ -0,0 +1,88 @@
+# utils/permissions.py
+
+from collections import namedtuple
+
+from nextcord import PermissionOverwrite
+
+# Права в канале тикета; объекты неизменяемы по смыслу и общие для всех тикетов
+HIDDEN = PermissionOverwrite(view_channel=False)
+AUTHOR = PermissionOverwrite(view_channel=True, send_messages=True)
+BOT = PermissionOverwrite(view_channel=True, manage_channels=True)
+ADMIN = PermissionOverwrite(view_channel=True, send_messages=True, manage_messages=True)
+SUPPORT = PermissionOverwrite(view_channel=True, send_messages=True)
+
+_GuildPerms = namedtuple("_GuildPerms", "config staff overwrites")
+_EMPTY = frozenset()
+
+
+class PermissionService:
+    """
+    Проверки «сотрудник ли это» и права для каналов тикетов.
+
+    Для каждого сервера один раз собираются множество id ролей персонала
+    (admin + support) и шаблон overwrites канала тикета. Проверка — это
+    пересечение множеств без создания объектов ролей, создание канала —
+    одна копия шаблона с добавленным автором.
+
+    Кеш сервера пересобирается при смене его конфигурации (ConfigRegistry
+    после reload отдаёт новый объект GuildConfig) и сбрасывается из событий
+    изменения/удаления ролей персонала. Кеша по участникам нет: роли
+    участника приходят вместе с каждым взаимодействием.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._guilds = {}
+
+    def _entry(self, guild) -> _GuildPerms:
+        config = self.registry.guild(guild.id)
+        entry = self._guilds.get(guild.id)
+        if entry is None or entry.config is not config:
+            entry = self._build(guild, config)
+            self._guilds[guild.id] = entry
+        return entry
+
+    def _build(self, guild, config) -> _GuildPerms:
+        if config is None:
+            return _GuildPerms(None, _EMPTY, {})
+        overwrites = {guild.default_role: HIDDEN, guild.me: BOT}
+        staff = set()
+        for role_id, overwrite in ((config.admin_role_id, ADMIN), (config.support_role_id, SUPPORT)):
+            if not role_id:
+                continue
+            staff.add(role_id)
+            role = guild.get_role(role_id)
+            if role is not None:
+                overwrites[role] = overwrite
+        return _GuildPerms(config, frozenset(staff), overwrites)
+
+    def is_staff(self, member) -> bool:
+        """Есть ли у участника роль admin или support этого сервера"""
+        staff = self._entry(member.guild).staff
+        if not staff:
+            return False
+        # Member._roles — отсортированный массив id; member.roles строил бы
+        # список объектов Role на каждый вызов
+        role_ids = getattr(member, "_roles", None)
+        if role_ids is None:
+            role_ids = [r.id for r in member.roles]
+        return not staff.isdisjoint(role_ids)
+
+    def ticket_overwrites(self, guild, author) -> dict:
+        """Overwrites для нового канала тикета автора author"""
+        overwrites = dict(self._entry(guild).overwrites)
+        overwrites[author] = AUTHOR
+        return overwrites
+
+    def invalidate(self, guild_id: int = None):
+        if guild_id is None:
+            self._guilds.clear()
+        else:
+            self._guilds.pop(guild_id, None)
+
+    # ─── события ─────────────────────────────────────────────────────────
+    def on_role_change(self, role):
+        """on_guild_role_update / on_guild_role_delete"""
+        entry = self._guilds.get(role.guild.id)
+        if entry is not None and role.id in entry.staff:
+            self.invalidate(role.guild.id)
@@ -0,0 +1,148 @@
+# utils/ratelimit.py
+
+import time
+import sqlite3
+import asyncio
+import threading
+from collections import OrderedDict, deque, namedtuple
+
+# Не больше rate срабатываний за скользящее окно длиной per секунд
+RateLimit = namedtuple("RateLimit", "rate per")
+
+
+def parse_limits(spec: str) -> dict:
+    """
+    Разбирает строку вида "ticket_select=1/300,feedback=3/60"
+    в {action: RateLimit}. Пустая строка — пустой словарь.
+    """
+    limits = {}
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        action, value = part.split("=", 1)
+        rate, per = value.split("/", 1)
+        limits[action.strip()] = RateLimit(int(rate), float(per))
+    return limits
+
+
+class MemoryBackend:
+    """
+    Скользящее окно в памяти процесса. Для каждого ключа хранится не больше
+    rate отметок времени; ключ удаляется, как только все его отметки выходят
+    из окна, так что память ограничена числом активных пользователей.
+    """
+
+    def __init__(self):
+        # key -> (deque отметок, лимит); порядок — по последнему обращению
+        self._hits = OrderedDict()
+
+    def hit(self, key: str, limit: RateLimit, now: float) -> bool:
+        self._evict(now)
+        entry = self._hits.get(key)
+        if entry is None or entry[1] != limit:
+            # Новый ключ или лимит сменился (!reload): окно под новый rate,
+            # последние отметки сохраняются
+            entry = self._hits[key] = (deque(entry[0] if entry else (), maxlen=limit.rate), limit)
+        self._hits.move_to_end(key)
+        window = entry[0]
+        while window and now - window[0] >= limit.per:
+            window.popleft()
+        if len(window) >= limit.rate:
+            return False
+        window.append(now)
+        return True
+
+    def reset(self, key: str):
+        self._hits.pop(key, None)
+
+    def _evict(self, now: float):
+        # Давно не обращавшиеся ключи лежат в начале
+        while self._hits:
+            window, limit = next(iter(self._hits.values()))
+            if window and now - window[-1] < limit.per:
+                break
+            self._hits.popitem(last=False)
+
+    def __len__(self):
+        return len(self._hits)
+
+
+class SQLiteBackend:
+    """
+    Скользящее окно в общем файле SQLite: несколько процессов/шардов бота,
+    указывающих на один файл, соблюдают одни и те же лимиты.
+    """
+
+    # Отметки старше суток удаляются при периодической чистке,
+    # поэтому окна длиннее суток этим бэкендом не поддерживаются
+    RETENTION = 24 * 3600.0
+
+    def __init__(self, path: str = "ratelimit.db"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS hits (key TEXT NOT NULL, ts REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_hits_key_ts ON hits (key, ts)")
+        self._last_sweep = 0.0
+
+    def hit(self, key: str, limit: RateLimit, now: float) -> bool:
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM hits WHERE key = ? AND ts <= ?", (key, now - limit.per))
+                (count,) = conn.execute("SELECT COUNT(*) FROM hits WHERE key = ?", (key,)).fetchone()
+                allowed = count < limit.rate
+                if allowed:
+                    conn.execute("INSERT INTO hits (key, ts) VALUES (?, ?)", (key, now))
+                if now - self._last_sweep > 60:
+                    conn.execute("DELETE FROM hits WHERE ts <= ?", (now - self.RETENTION,))
+                    self._last_sweep = now
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return allowed
+
+    def reset(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM hits WHERE key = ?", (key,))
+
+
+def make_backend(spec: str):
+    """"memory" (по умолчанию) или "sqlite:путь/к/файлу.db" """
+    if spec and spec.startswith("sqlite:"):
+        return SQLiteBackend(spec[len("sqlite:"):] or "ratelimit.db")
+    return MemoryBackend()
+
+
+class RateLimiter:
+    """
+    Лимиты по действиям с переопределением для отдельных серверов:
+    guild_limits[guild_id][action] важнее limits[action].
+    Действия без настроенного лимита не ограничиваются.
+    """
+
+    def __init__(self, limits: dict, guild_limits: dict = None, backend=None):
+        self.limits = limits
+        self.guild_limits = guild_limits or {}
+        self.backend = backend or MemoryBackend()
+        self._shared = not isinstance(self.backend, MemoryBackend)
+
+    def limit_for(self, guild_id, action: str):
+        return self.guild_limits.get(guild_id, {}).get(action) or self.limits.get(action)
+
+    async def hit(self, user_id, guild_id, action: str) -> bool:
+        """True, если действие разрешено (и засчитано), False — если лимит исчерпан"""
+        limit = self.limit_for(guild_id, action)
+        if limit is None:
+            return True
+        key = f"{guild_id}:{action}:{user_id}"
+        if self._shared:
+            return await asyncio.to_thread(self.backend.hit, key, limit, time.time())
+        return self.backend.hit(key, limit, time.time())
+
+    async def reset(self, user_id, guild_id, action: str):
+        key = f"{guild_id}:{action}:{user_id}"
+        if self._shared:
+            await asyncio.to_thread(self.backend.reset, key)
+        else:
+            self.backend.reset(key)
@@ -0,0 +1,110 @@
+# utils/recorder.py
+
+import traceback
+from datetime import datetime, timezone
+
+import nextcord
+
+from database.async_crud import (
+    run_db, record_messages, update_message, delete_message,
+    get_last_message_id, purge_channel_messages
+)
+from utils.transcript import message_record, raw_attachments_json, iter_history, dump_to_spool
+from utils.helpers import log_activity
+from utils.metrics import metrics
+
+BACKFILL_BATCH = 100
+
+
+def is_ticket_channel(channel) -> bool:
+    return getattr(channel, "name", "").startswith("ticket-")
+
+
+class TranscriptRecorder:
+    """
+    Записывает сообщения каналов тикетов в БД по мере их появления,
+    чтобы при закрытии строить транскрипт без запросов истории к Discord.
+
+    Канал считается синхронизированным, если он создан после запуска бота
+    или для него уже был сделан backfill. Для остальных (бот перезапускался,
+    пока тикет был открыт) при закрытии догружаются только пропущенные
+    сообщения — после последнего записанного.
+    """
+
+    def __init__(self):
+        self._started_at = datetime.now(timezone.utc)
+        self._synced = set()
+
+    def is_synced(self, channel) -> bool:
+        return channel.id in self._synced or channel.created_at >= self._started_at
+
+    async def on_message(self, message: nextcord.Message):
+        if is_ticket_channel(message.channel):
+            await record_messages([message_record(message)])
+
+    # Правки и удаления — по raw-событиям: обычные приходят только для сообщений
+    # из кеша nextcord, а записанное до перезапуска бота в кеше нет
+    async def on_raw_message_edit(self, payload: nextcord.RawMessageUpdateEvent, channel):
+        data = payload.data
+        # Без content — не правка автора, а, например, подгрузка превью ссылки
+        if is_ticket_channel(channel) and "content" in data:
+            edited = data.get("edited_timestamp")
+            edited_at = nextcord.utils.parse_time(edited) if edited else datetime.now(timezone.utc)
+            await update_message(payload.message_id, data["content"] or "",
+                                 raw_attachments_json(data.get("attachments", [])),
+                                 edited_at.replace(tzinfo=None))
+
+    async def on_raw_message_delete(self, payload: nextcord.RawMessageDeleteEvent, channel):
+        if is_ticket_channel(channel):
+            await delete_message(payload.message_id)
+
+    async def on_raw_bulk_message_delete(self, payload: nextcord.RawBulkMessageDeleteEvent, channel):
+        if is_ticket_channel(channel):
+            for message_id in payload.message_ids:
+                await delete_message(message_id)
+
+    async def on_channel_delete(self, channel):
+        if is_ticket_channel(channel):
+            self._synced.discard(channel.id)
+            await purge_channel_messages(channel.id)
+
+    async def backfill(self, channel):
+        """Догружает сообщения, пришедшие, пока бот не слушал канал"""
+        # Сообщения после запуска уже записаны слушателем — пропуск может быть
+        # только до него, поэтому ищем последнее записанное раньше старта
+        started_id = nextcord.utils.time_snowflake(self._started_at)
+        last_id = await get_last_message_id(channel.id, before_id=started_id)
+        after = nextcord.Object(id=last_id) if last_id else None
+        batch, total = [], 0
+        with metrics.timer("history_fetch_seconds"):
+            async for msg in iter_history(channel, after=after):
+                batch.append(message_record(msg))
+                if len(batch) >= BACKFILL_BATCH:
+                    await record_messages(batch)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                await record_messages(batch)
+                total += len(batch)
+        self._synced.add(channel.id)
+        if total:
+            log_activity("transcript_backfill", channel=channel.id, messages=total)
+
+    async def sync_guilds(self, guilds):
+        """Backfill всех открытых тикетов (запускается в фоне из on_ready)"""
+        for guild in guilds:
+            for channel in guild.text_channels:
+                if is_ticket_channel(channel) and not self.is_synced(channel):
+                    try:
+                        await self.backfill(channel)
+                    except nextcord.HTTPException:
+                        traceback.print_exc()
+
+    async def capture(self, channel_id: int, ticket_id, channel=None) -> tuple:
+        """
+        Spool-файл и вложения тикета; история запрашивается только при пропусках.
+        Без channel (канал уже удалён) берётся то, что записано в БД.
+        """
+        if channel is not None and not self.is_synced(channel):
+            await self.backfill(channel)
+        return await run_db(dump_to_spool, channel_id, ticket_id)
@@ -0,0 +1,157 @@
+# utils/registry.py
+
+import os
+import json
+import time
+import threading
+from collections import namedtuple
+
+from utils.ratelimit import parse_limits
+from utils.exporters import EXPORTERS
+
+Tag = namedtuple("Tag", "value label emoji")
+
+GuildConfig = namedtuple(
+    "GuildConfig",
+    "guild_id admin_role_id support_role_id category_id admin_channel_id tags rate_limits"
+    " transcript_format"
+)
+
+# Формат транскрипта по умолчанию (см. utils.exporters); PDF дорог —
+# его лучше строить по запросу командой !transcript
+DEFAULT_TRANSCRIPT_FORMAT = "html"
+
+
+class ConfigRegistry:
+    """
+    Настройки серверов и шаблон ответов, загруженные в память.
+
+    Источники:
+      - env_guilds — настройки из переменных окружения (старый способ, GUILD_ID_1/2);
+      - guilds_path — JSON с секциями "default" и "guilds" (перекрывает env);
+      - template_path — response_template.json.
+
+    Файлы перечитываются только если изменился их mtime (проверка не чаще
+    раза в check_interval секунд) или по reload(force=True).
+    Поиск настроек сервера — обращение к словарю по guild_id.
+    """
+
+    def __init__(self, guilds_path: str, template_path: str,
+                 env_guilds: dict = None, check_interval: float = 5.0):
+        self.guilds_path = guilds_path
+        self.template_path = template_path
+        self.env_guilds = {gid: cfg for gid, cfg in (env_guilds or {}).items() if gid}
+        self.check_interval = check_interval
+        # Живой словарь {guild_id: {action: RateLimit}} — его читает RateLimiter
+        self.rate_limits = {}
+        self._lock = threading.Lock()
+        self._mtimes = None
+        self._checked_at = 0.0
+        self._template = {}
+        self._default_tags = {}
+        self._guilds = {}
+        self.reload(force=True)
+
+    # ─── lookup ───────────────────────────────────────────────────────────
+    def guild(self, guild_id: int):
+        self._maybe_reload()
+        return self._guilds.get(guild_id)
+
+    def guild_ids(self) -> list:
+        self._maybe_reload()
+        return list(self._guilds)
+
+    def template(self) -> dict:
+        self._maybe_reload()
+        return self._template
+
+    def tags(self, guild_id: int = None) -> list:
+        cfg = self.guild(guild_id)
+        return list((cfg.tags if cfg else self._default_tags).values())
+
+    def transcript_format(self, guild_id: int) -> str:
+        cfg = self.guild(guild_id)
+        return cfg.transcript_format if cfg else DEFAULT_TRANSCRIPT_FORMAT
+
+    def tag_title(self, guild_id: int, value: str) -> str:
+        """Заголовок тега из шаблона ответов, иначе «эмодзи метка» из настроек"""
+        title = self.template().get("tags", {}).get(value)
+        if title:
+            return title
+        cfg = self.guild(guild_id)
+        tag = (cfg.tags if cfg else self._default_tags).get(value)
+        return f"{tag.emoji} {tag.label}".strip() if tag else value
+
+    # ─── loading ──────────────────────────────────────────────────────────
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self.reload()
+
+    def _current_mtimes(self) -> tuple:
+        return tuple(
+            os.stat(p).st_mtime_ns if os.path.exists(p) else None
+            for p in (self.guilds_path, self.template_path)
+        )
+
+    def reload(self, force: bool = False) -> bool:
+        """Перечитывает файлы, если они изменились. Возвращает True, если перечитал"""
+        with self._lock:
+            mtimes = self._current_mtimes()
+            if not force and mtimes == self._mtimes:
+                return False
+            template = _read_json(self.template_path)
+            data = _read_json(self.guilds_path)
+
+            default = data.get("default", {})
+            default_tags = _parse_tags(default.get("tags", []))
+            raw_guilds = {gid: dict(cfg) for gid, cfg in self.env_guilds.items()}
+            for gid, cfg in data.get("guilds", {}).items():
+                raw_guilds.setdefault(int(gid), {}).update(cfg)
+
+            guilds = {
+                gid: _build_guild(gid, cfg, default, default_tags)
+                for gid, cfg in raw_guilds.items()
+            }
+            self._template, self._default_tags, self._guilds = template, default_tags, guilds
+            self.rate_limits.clear()
+            self.rate_limits.update({gid: cfg.rate_limits for gid, cfg in guilds.items()})
+            self._mtimes = mtimes
+            return True
+
+
+def _read_json(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _parse_tags(items: list) -> dict:
+    return {t["value"]: Tag(t["value"], t["label"], t.get("emoji", "")) for t in items}
+
+
+def _build_guild(guild_id: int, cfg: dict, default: dict, default_tags: dict) -> GuildConfig:
+    merged = {**default, **cfg}
+    limits = merged.get("rate_limits") or {}
+    if isinstance(limits, str):
+        limits = parse_limits(limits)
+    else:
+        limits = parse_limits(",".join(f"{k}={v}" for k, v in limits.items()))
+    transcript_format = merged.get("transcript_format") or DEFAULT_TRANSCRIPT_FORMAT
+    if transcript_format not in EXPORTERS:
+        # Неизвестный формат сорвал бы рендер при каждом закрытии тикета
+        print(f"[WARN] guild {guild_id}: unknown transcript_format {transcript_format!r}, "
+              f"using {DEFAULT_TRANSCRIPT_FORMAT!r}")
+        transcript_format = DEFAULT_TRANSCRIPT_FORMAT
+    return GuildConfig(
+        guild_id=guild_id,
+        admin_role_id=merged.get("admin_role_id") or None,
+        support_role_id=merged.get("support_role_id") or None,
+        category_id=merged.get("category_id") or None,
+        admin_channel_id=merged.get("admin_channel_id") or None,
+        tags=_parse_tags(cfg["tags"]) if "tags" in cfg else default_tags,
+        rate_limits=limits,
+        transcript_format=transcript_format,
+    )
@@ -0,0 +1,143 @@
+# utils/render_service.py
+
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.exporters import export, read_archive
+from utils.transcript import read_spool
+from utils.metrics import metrics
+
+
+class RenderError(Exception):
+    """Не удалось отрендерить транскрипт"""
+
+class RenderQueueFull(RenderError):
+    """Очередь рендеринга переполнена и слот не освободился вовремя"""
+
+class RenderTimeout(RenderError):
+    """Рендеринг занял больше отведённого времени"""
+
+
+def _init_worker():
+    # PDF-стек (reportlab, шрифт, PIL) загружается в каждом процессе рендера
+    # при его запуске, а не при первом тикете и не в процессе бота
+    try:
+        from utils.pdf_generator import load_fonts
+        load_fonts()
+    except Exception:
+        pass  # та же ошибка повторится при рендере PDF, с трассировкой
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def _mp_context():
+    # Не fork: в процессе бота работают потоки (БД, журнал, резолвер aiohttp),
+    # и процесс, скопированный в момент, когда один из них держит блокировку,
+    # зависнет на ней. Воркеры порождает однопоточный forkserver (или spawn)
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+# Функции ниже выполняются в процессах пула и возвращают (результат,
+# {формат: секунды}) — метрики пишет основной процесс
+
+def _render_spool(formats, ticket_id, author_name, issue_description, spool_path, attachments):
+    # Сообщения читаются из файла по одному
+    paths, timings = {}, {}
+    for fmt in formats:
+        start = time.perf_counter()
+        paths[fmt] = export(fmt, ticket_id, author_name, issue_description, read_spool(spool_path), attachments)
+        timings[fmt] = time.perf_counter() - start
+    return paths, timings
+
+
+def _render_archive(fmt, archive_path):
+    start = time.perf_counter()
+    header, messages = read_archive(archive_path)
+    path = export(fmt, header["ticket"], header["author"], header["issue"],
+                  messages, [tuple(a) for a in header["attachments"]])
+    return path, {fmt: time.perf_counter() - start}
+
+
+class TranscriptRenderer:
+    """
+    Рендерит транскрипты (см. utils.exporters) в пуле процессов, не блокируя event loop.
+
+    - workers: число процессов (по умолчанию — число ядер);
+    - max_pending: сколько задач может быть в работе и в очереди одновременно;
+    - queue_timeout: сколько ждать свободного слота, прежде чем RenderQueueFull;
+    - job_timeout: сколько ждать результата одной задачи, прежде чем RenderTimeout.
+
+    Слот освобождается только когда процесс действительно закончил работу,
+    поэтому зависшие задачи тоже учитываются в лимите очереди.
+    """
+
+    def __init__(self, workers: int = None, max_pending: int = 16,
+                 queue_timeout: float = 30, job_timeout: float = 120):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_timeout = queue_timeout
+        self.job_timeout = job_timeout
+        self._slots = asyncio.Semaphore(max_pending)
+        self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             mp_context=_mp_context())
+        return self._pool
+
+    async def warm_up(self):
+        """Запускает процессы заранее (с загрузкой PDF-стека), чтобы первый тикет не ждал их старта"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._get_pool(), _warm_up)
+
+    async def render(self, ticket_id: str, author_name: str, issue_description: str,
+                     spool_path: str, attachments: list, formats=("pdf",)) -> dict:
+        """
+        Ставит задачу в очередь и возвращает {формат: путь к файлу}.
+        spool_path — файл с перепиской (см. utils.transcript.dump_to_spool).
+        """
+        return await self._submit(ticket_id, _render_spool, tuple(formats), ticket_id,
+                                  author_name, issue_description, spool_path, attachments)
+
+    async def render_archive(self, ticket_id, archive_path: str, fmt: str = "pdf") -> str:
+        """Рендерит формат fmt из ранее сохранённого архива (ленивый PDF)"""
+        return await self._submit(ticket_id, _render_archive, fmt, archive_path)
+
+    async def _submit(self, ticket_id, fn, *args):
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            metrics.inc("render_rejected_total", reason="queue_full")
+            raise RenderQueueFull(f"render queue is full (ticket {ticket_id})")
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self._get_pool(), fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            result, timings = await asyncio.wait_for(asyncio.shield(future), self.job_timeout)
+        except asyncio.TimeoutError:
+            metrics.inc("render_rejected_total", reason="timeout")
+            raise RenderTimeout(f"render of ticket {ticket_id} exceeded {self.job_timeout}s")
+        for fmt, seconds in timings.items():
+            metrics.observe("transcript_export_seconds", seconds, format=fmt)
+        # Вместе с ожиданием слота и передачей данных в процесс
+        metrics.observe("render_job_seconds", time.perf_counter() - start)
+        return result
+
+    async def close(self):
+        """Отменяет ожидающие задачи и дожидается остановки процессов"""
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
@@ -0,0 +1,94 @@
+# utils/shared_state.py
+
+import asyncio
+import sqlite3
+import threading
+
+
+class MemorySetStore:
+    """Именованные множества в памяти процесса (один процесс бота)"""
+
+    def __init__(self):
+        self._sets = {}
+
+    def replace(self, name: str, members):
+        self._sets[name] = set(members)
+
+    def contains(self, name: str, member) -> bool:
+        return member in self._sets.get(name, ())
+
+    def count(self, name: str) -> int:
+        return len(self._sets.get(name, ()))
+
+
+class SQLiteSetStore:
+    """
+    Именованные множества в общем файле SQLite: все процессы/шарды бота,
+    указывающие на один файл, видят одни и те же данные.
+    """
+
+    def __init__(self, path: str = "shared_state.db"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS shared_sets ("
+            "name TEXT NOT NULL, member TEXT NOT NULL, PRIMARY KEY (name, member)) WITHOUT ROWID"
+        )
+
+    def replace(self, name: str, members):
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM shared_sets WHERE name = ?", (name,))
+                conn.executemany("INSERT OR IGNORE INTO shared_sets (name, member) VALUES (?, ?)",
+                                 [(name, str(m)) for m in members])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def contains(self, name: str, member) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM shared_sets WHERE name = ? AND member = ?",
+                                     (name, str(member))).fetchone()
+        return row is not None
+
+    def count(self, name: str) -> int:
+        with self._lock:
+            (n,) = self._conn.execute("SELECT COUNT(*) FROM shared_sets WHERE name = ?", (name,)).fetchone()
+        return n
+
+
+def make_store(spec: str):
+    """"memory" (по умолчанию) или "sqlite:путь/к/файлу.db" """
+    if spec and spec.startswith("sqlite:"):
+        return SQLiteSetStore(spec[len("sqlite:"):] or "shared_state.db")
+    return MemorySetStore()
+
+
+class SharedSet:
+    """
+    Асинхронное множество поверх хранилища из make_store.
+    Обращения к общему хранилищу выполняются вне event loop.
+    """
+
+    def __init__(self, name: str, store=None):
+        self.name = name
+        self.store = store or MemorySetStore()
+        self._shared = not isinstance(self.store, MemorySetStore)
+
+    async def _run(self, fn, *args):
+        if self._shared:
+            return await asyncio.to_thread(fn, self.name, *args)
+        return fn(self.name, *args)
+
+    async def replace(self, members):
+        await self._run(self.store.replace, list(members))
+
+    async def contains(self, member) -> bool:
+        return await self._run(self.store.contains, member)
+
+    async def count(self) -> int:
+        return await self._run(self.store.count)
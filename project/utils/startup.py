@@ -0,0 +1,134 @@
+# utils/startup.py
+
+import sys
+import time
+import asyncio
+import builtins
+import threading
+import importlib.util
+
+
+class ImportProfiler:
+    """
+    Время импорта модулей в стиле python -X importtime: для каждого модуля,
+    впервые импортированного оператором import, — собственное время и время
+    вместе с вложенными импортами.
+
+    Перехватывает builtins.__import__ только в потоке, вызвавшем start(),
+    и только до stop() — на работу бота после запуска не влияет.
+    Подмодули из "from pkg import mod" засчитываются импортирующему модулю.
+    """
+
+    def __init__(self):
+        self.records = []  # (модуль, собственное время, с вложенными, глубина) — в порядке завершения
+        self._stack = []   # время вложенных импортов текущих модулей
+        self._original = None
+        self._thread = None
+
+    def start(self):
+        if self._original is None:
+            self._original = builtins.__import__
+            self._thread = threading.get_ident()
+            builtins.__import__ = self._import
+
+    def stop(self):
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        original = self._original or builtins.__import__
+        if threading.get_ident() != self._thread:
+            return original(name, globals, locals, fromlist, level)
+        module = name
+        if level:
+            try:
+                module = importlib.util.resolve_name("." * level + name, (globals or {}).get("__package__"))
+            except (ImportError, ValueError):
+                module = None
+        if not module or module in sys.modules:
+            return original(name, globals, locals, fromlist, level)
+
+        start = time.perf_counter()
+        self._stack.append(0.0)
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            cumulative = time.perf_counter() - start
+            nested = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += cumulative
+            self.records.append((module, cumulative - nested, cumulative, len(self._stack)))
+
+
+class StartupProfile:
+    """
+    Этапы запуска бота: импорт main.py, миграции, подключение к шлюзу
+    (до первого on_ready), фоновый прогрев рендера. Время этапа — от
+    начала импорта main.py; разбивка импорта по модулям — ImportProfiler.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}  # этап -> (с начала запуска, длительность)
+        self.imports = ImportProfiler()
+        self._tasks = set()
+
+    def _record(self, name: str, begin: float):
+        end = time.perf_counter()
+        self.phases.setdefault(name, (end - self.started, end - begin))
+
+    def phase(self, name: str):
+        """with startup.phase("migrations"): ..."""
+        return _Phase(self, name)
+
+    def mark(self, name: str, since: str = None):
+        """Этап закончился сейчас; начался после этапа since (по умолчанию — с начала запуска)"""
+        begin = self.started + self.phases[since][0] if since in self.phases else self.started
+        self._record(name, begin)
+
+    def finish_imports(self):
+        self.imports.stop()
+        self._record("import", self.started)
+
+    def track(self, name: str, coro):
+        """Запускает coro в фоне и записывает его длительность как этап name"""
+        begin = time.perf_counter()
+
+        async def run():
+            await coro
+            self._record(name, begin)
+
+        task = asyncio.create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def report(self, top: int = 15) -> str:
+        """Этапы и самые долгие импорты (с вложенными), как в -X importtime, в микросекундах"""
+        lines = [f"{name:<16} {at * 1000:8.0f} ms  (+{took * 1000:.0f} ms)"
+                 for name, (at, took) in sorted(self.phases.items(), key=lambda kv: kv[1][0])]
+        records = sorted(self.imports.records, key=lambda r: -r[2])[:top]
+        if records:
+            lines += ["", "import time: self [us] | cumulative | imported package"]
+            lines += [f"import time: {int(own * 1e6):>9} | {int(total * 1e6):>10} | {'  ' * depth}{module}"
+                      for module, own, total, depth in records]
+        return "\n".join(lines)
+
+
+class _Phase:
+    __slots__ = ("_profile", "_name", "_begin")
+
+    def __init__(self, profile, name):
+        self._profile, self._name = profile, name
+
+    def __enter__(self):
+        self._begin = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._profile._record(self._name, self._begin)
+
+
+# Общий экземпляр процесса: часы идут с первого импорта этого модуля
+startup = StartupProfile()
@@ -0,0 +1,67 @@
+# utils/transcript.py
+
+import os
+import json
+from collections import namedtuple
+
+from database.crud import iter_channel_messages
+
+SPOOL_DIR = os.path.join("logs", "spool")
+
+# Лёгкая копия nextcord.Attachment — сами сообщения в памяти не держим
+AttachmentRef = namedtuple("AttachmentRef", "id filename url size")
+
+
+def message_record(msg) -> dict:
+    """Строка для таблицы transcript_messages из nextcord.Message"""
+    return {
+        "message_id": msg.id,
+        "channel_id": msg.channel.id,
+        "author": str(msg.author),
+        "content": msg.content or "",
+        "attachments": attachments_json(msg.attachments),
+        "created_at": msg.created_at.replace(tzinfo=None),
+        "edited_at": msg.edited_at.replace(tzinfo=None) if msg.edited_at else None,
+    }
+
+
+def attachments_json(attachments) -> str:
+    return json.dumps([[a.id, a.filename, a.url, a.size] for a in attachments], ensure_ascii=False)
+
+
+def raw_attachments_json(items: list) -> str:
+    """То же для вложений из сырых данных шлюза (payload.data)"""
+    return json.dumps([[int(a["id"]), a["filename"], a["url"], a["size"]] for a in items], ensure_ascii=False)
+
+
+async def iter_history(channel, after=None):
+    """
+    Отдаёт историю канала от старых сообщений к новым (после сообщения after,
+    если задано). Discord отдаёт историю страницами, так что в памяти
+    одновременно находится не больше страницы.
+    """
+    async for msg in channel.history(limit=None, after=after, oldest_first=True):
+        yield msg
+
+
+def dump_to_spool(db, channel_id: int, ticket_id) -> tuple:
+    """
+    Выгружает записанные сообщения канала в spool-файл (JSON lines) для
+    рендерера. Выполняется в потоке БД. Возвращает (путь, список AttachmentRef).
+    """
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    path = os.path.join(SPOOL_DIR, f"ticket_{ticket_id}.jsonl")
+    atts = []
+    with open(path, "w", encoding="utf-8") as f:
+        for row in iter_channel_messages(db, channel_id):
+            record = {"author": row.author, "content": row.content}
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            atts.extend(AttachmentRef(*a) for a in json.loads(row.attachments))
+    return path, atts
+
+
+def read_spool(path: str):
+    """Построчно читает записи из spool-файла"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)